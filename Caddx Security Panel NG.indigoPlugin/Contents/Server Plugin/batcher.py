@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import Callable
+
+import state
+
+DEFAULT_WINDOW = 0.25  # Seconds state changes are held before being written to Indigo
+
+
+class UpdateBatcher:
+    """
+    Collects device state changes and writes each device's pending changes with one server call.
+
+    A burst of transitions (arming, an alarm) changes the same devices several times in a few hundred
+    milliseconds. Changes are held per device for up to window seconds after the first one arrives; a later value
+    for the same state replaces the pending one, so each state is written once per window with its latest value.
+    With a window of 0 every change is written immediately.
+
+    add() and flush() are called from the communication loop; discard() may be called from Indigo's thread.
+    """
+
+    def __init__(self, push: Callable[[int, state.StateChanges], None], window: float = DEFAULT_WINDOW):
+        """
+        :param push: Callable that writes (state id, value) pairs to the Indigo device with the given id.
+        :param window: Seconds to hold changes before writing them.
+        """
+        self._push = push
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: dict[int, dict[str, object]] = {}   # Device id -> state id -> latest value
+        self._deadline: float | None = None
+        self.changes_queued = 0
+        self.changes_written = 0
+        self.server_calls = 0
+
+    def add(self, device_id: int | None, changes: state.StateChanges) -> None:
+        """
+        Queue state changes for a device.
+        :param device_id: Indigo device id, or None if no device is configured for the zone/partition.
+        :param changes: (state id, value) pairs that changed.
+        :return: None
+        """
+        if device_id is None or not changes:
+            return
+        with self._lock:
+            self._pending.setdefault(device_id, {}).update(changes)
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.window
+        self.changes_queued += len(changes)
+        if self.window <= 0:
+            self.flush()
+
+    def discard(self, device_id: int) -> None:
+        """
+        Drop pending changes for a device that is no longer running.
+        :param device_id: Indigo device id.
+        :return: None
+        """
+        with self._lock:
+            self._pending.pop(device_id, None)
+
+    def timeout(self) -> float | None:
+        """
+        :return: Seconds until pending changes are due, 0 if they are overdue, or None if nothing is pending.
+        """
+        deadline = self._deadline
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Write pending changes if the window has ended.
+        :param force: Write them regardless of the window, e.g. when the loop stops.
+        :return: Number of devices written.
+        """
+        with self._lock:
+            if self._deadline is None or not force and time.monotonic() < self._deadline:
+                return 0
+            pending = self._pending
+            self._pending = {}
+            self._deadline = None
+        for device_id, changes in pending.items():
+            self._push(device_id, list(changes.items()))
+            self.changes_written += len(changes)
+            self.server_calls += 1
+        return len(pending)
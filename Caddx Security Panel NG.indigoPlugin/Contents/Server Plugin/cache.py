@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+
+class PanelCache:
+    """
+    On-disk cache of panel data that rarely changes and is slow to read over the serial link.
+
+    Entries are valid only for the panel configuration they were read from: the cache key combines the panel
+    firmware with the interface configuration flags, and a cache file written under a different key is ignored.
+    Individual entries are replaced whenever a fresh read differs, and the file is rewritten atomically.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, logger: logging.Logger = None):
+        self._path = path
+        self._logger = logger or logging.getLogger(__name__)
+        self._key = None
+        self._zone_names: dict[str, str] = {}
+        self._program_data: dict[str, str] = {}
+        self._extra: dict[str, object] = {}
+        self._dirty = False
+
+    @staticmethod
+    def make_key(firmware: str, flags: bytes | bytearray) -> str:
+        """
+        Build the cache key for a panel configuration.
+        :param firmware: Panel firmware version from the Interface Configuration response.
+        :param flags: Transition message and request command flag bytes from the same response.
+        :return: Cache key.
+        """
+        return f"{firmware}:{bytes(flags).hex()}"
+
+    @property
+    def key(self) -> str | None:
+        return self._key
+
+    def load(self, key: str = None) -> bool:
+        """
+        Load the cache file if it was written for the given key; otherwise start empty.
+        :param key: Cache key from make_key(), or None to accept whatever configuration the file was written for,
+            e.g. on a warm restart before the panel has reported its configuration.
+        :return: True if cached entries were loaded.
+        """
+        self._key = key
+        self._zone_names = {}
+        self._program_data = {}
+        self._extra = {}
+        self._dirty = False
+        try:
+            with open(self._path, "r", encoding="utf-8") as cache_file:
+                data = json.load(cache_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as err:
+            self._logger.warning(f"Ignoring unreadable panel cache '{self._path}': {err}")
+            return False
+        if key is None and data.get("version") == self.VERSION:
+            key = self._key = data.get("key")
+        if data.get("version") != self.VERSION or data.get("key") != key:
+            self._logger.info("Panel firmware or interface configuration changed; panel cache discarded")
+            self._dirty = True
+            return False
+        self._zone_names = data.get("zoneNames", {})
+        self._program_data = data.get("programData", {})
+        self._extra = data.get("extra", {})
+        return True
+
+    def save(self) -> None:
+        """
+        Write the cache file if anything changed since it was loaded or last saved.
+        :return: None
+        """
+        if not self._dirty or self._key is None:
+            return
+        data = {
+            "version": self.VERSION,
+            "key": self._key,
+            "zoneNames": self._zone_names,
+            "programData": self._program_data,
+            "extra": self._extra,
+        }
+        temp_path = f"{self._path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(data, cache_file, indent=1, sort_keys=True)
+            os.replace(temp_path, self._path)
+            self._dirty = False
+        except OSError as err:
+            self._logger.warning(f"Unable to write panel cache '{self._path}': {err}")
+
+    def zone_names(self) -> dict[int, str]:
+        """
+        :return: Cached zone names keyed by zone number (1-based).
+        """
+        return {int(zone): name for zone, name in self._zone_names.items()}
+
+    def set_zone_name(self, zone: int, name: str) -> bool:
+        """
+        Store a zone name read from the panel.
+        :param zone: Zone number (1-based).
+        :param name: Zone name.
+        :return: True if the cached entry was missing or different.
+        """
+        if self._zone_names.get(str(zone)) == name:
+            return False
+        self._zone_names[str(zone)] = name
+        self._dirty = True
+        return True
+
+    def program_data(self, address: int, location: int) -> bytes | None:
+        """
+        :param address: Device bus address.
+        :param location: Logical location.
+        :return: Cached program data bytes, or None if not cached.
+        """
+        data = self._program_data.get(f"{address}:{location}")
+        return bytes.fromhex(data) if data is not None else None
+
+    def set_program_data(self, address: int, location: int, data: bytes | bytearray) -> bool:
+        """
+        Store program data read from the panel.
+        :param address: Device bus address.
+        :param location: Logical location.
+        :param data: Data bytes from the Program Data response.
+        :return: True if the cached entry was missing or different.
+        """
+        key = f"{address}:{location}"
+        value = bytes(data).hex()
+        if self._program_data.get(key) == value:
+            return False
+        self._program_data[key] = value
+        self._dirty = True
+        return True
+
+    def get(self, name: str, default=None):
+        """
+        :param name: Name of a miscellaneous cached value.
+        :param default: Returned when the value is not cached.
+        :return: Cached JSON-compatible value.
+        """
+        return self._extra.get(name, default)
+
+    def set(self, name: str, value) -> bool:
+        """
+        Store a miscellaneous JSON-compatible value.
+        :param name: Value name.
+        :param value: Value to cache.
+        :return: True if the cached value was missing or different.
+        """
+        if self._extra.get(name) == value:
+            return False
+        self._extra[name] = value
+        self._dirty = True
+        return True
@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from typing import NamedTuple
+
+import constants as const
+
+
+class PanelCapabilities(NamedTuple):
+    """
+    The message types a panel's Interface Configuration enables, compiled once from its flag bytes so that
+    checking whether a request can be sent is a set lookup rather than a walk over the flags.
+    """
+    requests: frozenset         # Request MessageTypes the panel accepts
+    transitions: frozenset      # Response/indication MessageTypes the panel sends when something changes
+
+    @classmethod
+    def from_flags(cls, transition_flags: bytes | bytearray, request_flags: bytes | bytearray) -> "PanelCapabilities":
+        """
+        :param transition_flags: The two transition message flag bytes of the Interface Configuration response.
+        :param request_flags: The four request command flag bytes of the same response.
+        :return: The compiled capabilities.
+        """
+        return cls(frozenset(message_type for message_type, (index, flag) in const.RequestFlags.items()
+                             if request_flags[index] & flag),
+                   frozenset(message_type for message_type, (index, flag) in const.TransitionFlags.items()
+                             if transition_flags[index] & flag))
+
+    @classmethod
+    def from_json(cls, value) -> "PanelCapabilities | None":
+        """
+        :param value: Value written by to_json(), e.g. from the panel cache.
+        :return: The capabilities, or None if the value is missing or not understood.
+        """
+        try:
+            return cls(frozenset(const.MessageType[name] for name in value["requests"]),
+                       frozenset(const.MessageType[name] for name in value["transitions"]))
+        except (KeyError, TypeError):
+            return None
+
+    def to_json(self) -> dict[str, list[str]]:
+        return {"requests": sorted(message_type.name for message_type in self.requests),
+                "transitions": sorted(message_type.name for message_type in self.transitions)}
+
+    def supports(self, message_type: const.MessageType) -> bool:
+        """
+        :param message_type: A request type.
+        :return: True if the panel accepts it. Requests without an enable flag are always allowed.
+        """
+        return message_type in self.requests or message_type not in const.RequestFlags
+
+    def missing_required(self) -> list[str]:
+        """
+        :return: Names of the required messages the panel does not enable; empty if it has them all.
+        """
+        missing = [message_type.name for message_type in sorted(const.RequiredTransitions - self.transitions)]
+        missing += [message_type.name for message_type in sorted(const.RequiredRequests - self.requests)]
+        missing += [" or ".join(message_type.name for message_type in sorted(group))
+                    for group in const.RequiredRequestGroups if not group & self.requests]
+        return missing
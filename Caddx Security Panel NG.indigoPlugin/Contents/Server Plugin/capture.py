@@ -0,0 +1,296 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import struct
+import threading
+import time
+from enum import IntEnum
+from typing import Iterable, Iterator, NamedTuple
+
+MAGIC = b"CDXCAP1\n"
+_FILE_HEADER = struct.Struct("<8sdd")  # Magic, wall clock time and monotonic time when the file was started
+_RECORD_HEADER = struct.Struct("<dBH")  # Monotonic timestamp, direction, data length
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_BACKUPS = 4
+FLUSH_INTERVAL = 1.0  # Seconds between flushes of buffered records
+REPLAY_CHUNK = 65536  # Bytes of a capture held in memory at a time during replay
+
+
+class Direction(IntEnum):
+    RX = 0      # Panel to plugin
+    TX = 1      # Plugin to panel
+
+
+class CaptureRecord(NamedTuple):
+    timestamp: float            # Monotonic time of the read or write
+    direction: Direction
+    data: bytes
+
+
+class CaptureError(Exception):
+    """The file is not a serial capture."""
+
+
+class CaptureWriter:
+    """
+    Append-only binary capture of the raw bytes read from and written to the panel.
+
+    Each file starts with a header holding the wall clock and monotonic time it was started, followed by one
+    record per read or write: an 11 byte header (monotonic timestamp, direction, length) and the bytes as they
+    crossed the port, before any framing. When a file grows past max_bytes it is rotated like a log file: the
+    current file becomes path.1, path.1 becomes path.2 and so on, keeping at most backups old files. A file left
+    by an earlier writer is rotated when the first record is written.
+
+    One writer is kept across reconnects, so a flapping link adds to the current capture rather than rotating
+    away the one holding the original failure.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, backups: int = DEFAULT_BACKUPS,
+                 logger: logging.Logger = None):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._flushed_at = 0.0
+        self._stopped = False
+        self.records = 0
+        self.bytes_captured = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def record(self, direction: Direction, data: bytes | bytearray | memoryview) -> None:
+        """
+        Append one read or write. Safe to call from the reader and communication threads.
+        :param direction: Direction.RX for bytes read from the panel, Direction.TX for bytes written to it.
+        :param data: The raw bytes.
+        :return: None
+        """
+        if not data or self._stopped:
+            return
+        now = time.monotonic()
+        with self._lock:
+            try:
+                if self._file is None or self._size >= self._max_bytes:
+                    self._open(rotate=self._file is not None)
+                self._file.write(_RECORD_HEADER.pack(now, direction, len(data)))
+                self._file.write(data)
+                self._size += _RECORD_HEADER.size + len(data)
+                if now - self._flushed_at >= FLUSH_INTERVAL:
+                    self._file.flush()
+                    self._flushed_at = now
+            except OSError as err:
+                self._logger.error(f"Serial capture to '{self._path}' stopped: {err}")
+                self._close()
+                self._stopped = True
+                return
+        self.records += 1
+        self.bytes_captured += len(data)
+
+    def flush(self) -> None:
+        """
+        Write buffered records to the current capture file.
+        :return: None
+        """
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.flush()
+                except OSError as err:
+                    self._logger.error(f"Serial capture to '{self._path}' could not be flushed: {err}")
+
+    def close(self) -> None:
+        """
+        Flush and close the current capture file.
+        :return: None
+        """
+        with self._lock:
+            self._close()
+
+    def _open(self, rotate: bool) -> None:
+        self._close()
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        if rotate or os.path.exists(self._path):
+            for index in range(self._backups - 1, 0, -1):
+                if os.path.exists(f"{self._path}.{index}"):
+                    os.replace(f"{self._path}.{index}", f"{self._path}.{index + 1}")
+            if self._backups and os.path.exists(self._path):
+                os.replace(self._path, f"{self._path}.1")
+        self._file = open(self._path, "wb")
+        self._file.write(_FILE_HEADER.pack(MAGIC, time.time(), time.monotonic()))
+        self._size = _FILE_HEADER.size
+
+    def _close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+class CaptureConnection:
+    """
+    Wraps an open serial connection and records everything read from or written to it. Other attributes and
+    methods are passed through to the wrapped connection. Closing the connection flushes the writer but leaves it
+    open for the next connection.
+    """
+
+    def __init__(self, conn, writer: CaptureWriter):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_writer", writer)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._conn, name, value)
+
+    def read(self, size: int = 1) -> bytes:
+        data = self._conn.read(size)
+        self._writer.record(Direction.RX, data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        count = self._conn.readinto(buffer)
+        if count:
+            self._writer.record(Direction.RX, memoryview(buffer)[:count])
+        return count
+
+    def write(self, data: bytes | bytearray) -> int:
+        count = self._conn.write(data)
+        self._writer.record(Direction.TX, data)
+        return count
+
+    def close(self) -> None:
+        self._conn.close()
+        self._writer.flush()
+
+
+def capture_files(path: str) -> list[str]:
+    """
+    :param path: Path of the current capture file.
+    :return: The existing capture file and its rotated backups, oldest first.
+    """
+    files = [path] if os.path.exists(path) else []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        files.insert(0, f"{path}.{index}")
+        index += 1
+    return files
+
+
+def read_capture(paths: str | Iterable[str]) -> Iterator[CaptureRecord]:
+    """
+    Read the records of one or more capture files in order. A record cut short (the plugin stopped mid-write)
+    ends its file.
+    :param paths: A capture file, or several to be read one after another.
+    :return: Iterator of records.
+    :raises CaptureError: If a file is not a capture.
+    """
+    for path in [paths] if isinstance(paths, str) else paths:
+        with open(path, "rb") as capture_file:
+            header = capture_file.read(_FILE_HEADER.size)
+            if len(header) < _FILE_HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise CaptureError(f"'{path}' is not a serial capture file")
+            while True:
+                record_header = capture_file.read(_RECORD_HEADER.size)
+                if len(record_header) < _RECORD_HEADER.size:
+                    break
+                timestamp, direction, length = _RECORD_HEADER.unpack(record_header)
+                data = capture_file.read(length)
+                if len(data) < length:
+                    break
+                yield CaptureRecord(timestamp, Direction(direction), data)
+
+
+class ReplayConnection:
+    """
+    Read-only stand-in for a serial connection that plays back the received bytes of a capture.
+
+    With speed set, each read becomes available at its original spacing divided by speed (1.0 is real time);
+    with speed None everything is available immediately. Writes are counted and discarded. Reading past the end
+    of the capture raises EOFError, which stops a SerialReader the same way a lost connection does.
+    """
+
+    def __init__(self, records: Iterable[CaptureRecord], speed: float | None = None, timeout: float | None = 0.5):
+        self.timeout = timeout
+        self.baudrate = 0
+        self.bytes_written = 0
+        self._records = (record for record in records if record.direction == Direction.RX)
+        self._speed = speed
+        self._pending = bytearray()
+        self._next: CaptureRecord | None = None
+        self._first_timestamp: float | None = None
+        self._started = 0.0
+        self._exhausted = False
+
+    @property
+    def in_waiting(self) -> int:
+        self._fill(wait=False)
+        return len(self._pending)
+
+    def read(self, size: int = 1) -> bytes:
+        self._fill(wait=True)
+        if not self._pending and self._exhausted:
+            raise EOFError("End of capture")
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data: bytes | bytearray) -> int:
+        self.bytes_written += len(data)
+        return len(data)
+
+    def reset_input_buffer(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._exhausted = True
+        self._pending.clear()
+
+    def _fill(self, wait: bool) -> None:
+        """
+        Move the records that are due into the pending bytes. With wait set and nothing pending, sleep until the
+        next record is due, for no longer than the read timeout.
+        """
+        deadline = None
+        while not self._exhausted and len(self._pending) < REPLAY_CHUNK:
+            if self._next is None:
+                self._next = next(self._records, None)
+                if self._next is None:
+                    self._exhausted = True
+                    return
+            delay = self._delay(self._next)
+            if delay > 0:
+                if not wait or self._pending:
+                    return
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + (self.timeout if self.timeout is not None else delay)
+                if now >= deadline:
+                    return
+                time.sleep(min(delay, deadline - now))
+                continue
+            self._pending += self._next.data
+            self._next = None
+
+    def _delay(self, record: CaptureRecord) -> float:
+        if not self._speed:
+            return 0.0
+        if self._first_timestamp is None:
+            self._first_timestamp = record.timestamp
+            self._started = time.monotonic()
+        return self._started + (record.timestamp - self._first_timestamp) / self._speed - time.monotonic()
@@ -0,0 +1,257 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Iterator
+
+START_CHARACTER = 0x7e
+ESCAPE_CHARACTER = 0x7d
+ESCAPED_START = 0x5e
+ESCAPED_ESCAPE = 0x5d
+
+_START = b'\x7e'
+_ESCAPE = b'\x7d'
+_STUFFED_START = b'\x7d\x5e'
+_STUFFED_ESCAPE = b'\x7d\x5d'
+
+
+class FrameError(Exception):
+    """Base class for frames that cannot be decoded."""
+
+
+class ChecksumError(FrameError):
+    """The frame checksum does not match its contents."""
+
+
+class EscapeError(FrameError):
+    """The frame contains an escape character not followed by a valid escaped value."""
+
+
+class LengthError(FrameError):
+    """The frame length byte is missing, zero, or does not match the frame contents."""
+
+
+def fletcher16(data: bytes | bytearray | memoryview) -> int:
+    """
+    Calculate the Fletcher-16 checksum for the given data.
+
+    Both running sums are accumulated without reduction and reduced modulo 255 once at the end, which gives the
+    same result as reducing after every byte and drops two modulo operations per byte.
+    :param data: The data to be checksummed.
+    :return: 16-bit checksum.
+    """
+    sum1 = 0
+    sum2 = 0
+    for byte in data:
+        sum1 += byte
+        sum2 += sum1
+    return ((sum2 % 255) << 8) | (sum1 % 255)
+
+
+def stuff(data: bytes | bytearray) -> bytes:
+    """
+    Byte-stuff frame contents so no start character appears inside the frame.
+    :param data: Length, message and checksum bytes.
+    :return: Stuffed bytes.
+    """
+    return bytes(data).replace(_ESCAPE, _STUFFED_ESCAPE).replace(_START, _STUFFED_START)
+
+
+def unstuff(data: bytes | bytearray) -> bytes | bytearray:
+    """
+    Reverse byte-stuffing. The escape character is never the second byte of an escape sequence, so replacing
+    escaped start characters first cannot mis-pair an escaped escape character.
+    :param data: Stuffed bytes, without the start character.
+    :return: Unstuffed bytes, of the same type as data.
+    :raises EscapeError: If an escape character is not followed by a valid escaped value.
+    """
+    escapes = data.count(_ESCAPE)
+    if escapes:
+        if escapes != data.count(_STUFFED_START) + data.count(_STUFFED_ESCAPE):
+            raise EscapeError("Invalid escape sequence")
+        data = data.replace(_STUFFED_START, _START).replace(_STUFFED_ESCAPE, _ESCAPE)
+    return data
+
+
+def encode_frame(message_type: int, message_data: bytes | bytearray = None) -> bytes:
+    """
+    Build the complete wire frame for a message: start character, then the stuffed length, message and checksum.
+    :param message_type: Message type byte, including any ack-request bits.
+    :param message_data: Ancillary message data, if used.
+    :return: Frame ready to write to the serial port.
+    """
+    message = bytearray(2 + len(message_data) if message_data else 2)
+    message[0] = len(message) - 1
+    message[1] = message_type
+    if message_data:
+        message[2:] = message_data
+    message += fletcher16(message).to_bytes(2, byteorder="little")
+    return _START + stuff(message)
+
+
+def decode_frame(frame: bytes | bytearray) -> bytearray:
+    """
+    Decode one complete wire frame.
+    :param frame: Frame bytes, with or without the leading start character.
+    :return: The message, starting from the message type byte.
+    :raises FrameError: If the frame is malformed or fails its checksum.
+    """
+    if frame[:1] == _START:
+        frame = frame[1:]
+    data = bytearray(unstuff(frame))
+    if not data or not data[0] or len(data) != data[0] + 3:  # +3 for length and checksum
+        raise LengthError("Message data wrong length")
+    if not _verify(data):
+        raise ChecksumError("Invalid checksum")
+    return data
+
+
+def _verify(data: bytearray) -> bool:
+    """
+    Check the checksum of unstuffed frame contents, stripping the length and checksum bytes in place.
+    :param data: Length, message and checksum bytes. On return, the message starting from the message type byte.
+    :return: True if the checksum matched.
+    """
+    offered_checksum = data[-2] | (data[-1] << 8)
+    del data[-2:]
+    if offered_checksum != fletcher16(data):
+        return False
+    del data[0]
+    return True
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for the byte-stuffed, Fletcher-16 protected frames sent by the panel.
+
+    Raw bytes are appended with feed() (or pulled from a serial connection with read_from()) and complete,
+    unstuffed, checksum-verified messages are returned by frames(). Framing errors never discard buffered
+    input: the decoder drops the offending start character and resynchronizes on the next one, so good frames
+    queued behind a glitch are still delivered.
+    """
+
+    def __init__(self, logger: logging.Logger = None, read_size: int = 4096):
+        self._logger = logger or logging.getLogger(__name__)
+        self._buffer = bytearray()
+        self._position = 0  # Start of undecoded data; consumed bytes are dropped once per frames() call
+        self._read_buffer = bytearray(read_size)
+        self._read_view = memoryview(self._read_buffer)
+        self.bytes_received = 0
+        self.frames_decoded = 0
+        self.checksum_errors = 0
+        self.escape_errors = 0
+        self.length_errors = 0
+        self.resyncs = 0
+        self.discarded_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer) - self._position
+
+    def feed(self, data: bytes | bytearray | memoryview) -> None:
+        """
+        Append raw bytes received from the panel.
+        :param data: Raw, still byte-stuffed, data.
+        :return: None
+        """
+        self._buffer += data
+        self.bytes_received += len(data)
+
+    def read_from(self, conn) -> int:
+        """
+        Move everything currently waiting on the connection into the decoder with a single bulk read.
+        :param conn: Open pyserial connection.
+        :return: Number of bytes read.
+        """
+        waiting = conn.in_waiting
+        if not waiting:
+            return 0
+        view = self._read_view[:min(waiting, len(self._read_buffer))]
+        count = conn.readinto(view)
+        if count:
+            self._buffer += view[:count]
+            self.bytes_received += count
+        return count or 0
+
+    def frames(self) -> Iterator[bytearray]:
+        """
+        Yield all complete messages in the buffer. Incomplete trailing data is retained for the next call.
+        :return: Iterator of messages, each starting from the message type byte.
+        """
+        try:
+            while True:
+                message = self._next_frame()
+                if message is None:
+                    return
+                yield message
+        finally:
+            del self._buffer[:self._position]
+            self._position = 0
+
+    def _resync(self, position: int) -> None:
+        """
+        Discard buffered data up to (but not including) the next start character at or after position.
+        :param position: Index to start searching from.
+        :return: None
+        """
+        next_start = self._buffer.find(START_CHARACTER, position)
+        if next_start < 0:
+            next_start = len(self._buffer)
+        self.discarded_bytes += next_start - self._position
+        self.resyncs += 1
+        self._position = next_start
+
+    def _next_frame(self) -> None | bytearray:
+        buffer = self._buffer
+        while self._position < len(buffer):
+            start = self._position
+            if buffer[start] != START_CHARACTER:
+                self._logger.error("Invalid or missing start character. Resynchronizing.")
+                self._resync(start)
+                continue
+
+            # A start character never appears inside a frame, so the frame lies before the next one
+            next_start = buffer.find(START_CHARACTER, start + 1)
+            segment = buffer[start + 1:next_start] if next_start > 0 else buffer[start + 1:]
+            try:
+                if segment[:1] != _ESCAPE:
+                    length = segment[:1]
+                elif len(segment) > 1:
+                    length = unstuff(segment[:2])
+                else:
+                    length = b''  # Second half of an escaped length byte has not arrived yet
+                if length == b'\x00':
+                    raise LengthError("Invalid or missing message length.")
+                if length:
+                    # Each escape sequence adds one stuffed byte; grow the span until it holds the whole frame
+                    frame_length = length[0] + 3  # +3 for length and checksum. Both are stripped off below.
+                    stuffed_length = frame_length
+                    while True:
+                        escapes = segment.count(_ESCAPE, 0, stuffed_length)
+                        if frame_length + escapes == stuffed_length:
+                            break
+                        stuffed_length = frame_length + escapes
+                if not length or stuffed_length > len(segment):
+                    if next_start < 0:
+                        return None  # Incomplete; wait for more data
+                    raise LengthError("Message data wrong length.")
+                del segment[stuffed_length:]
+                data = unstuff(segment) if escapes else segment
+            except EscapeError:
+                self._logger.error("Invalid escape sequence. Resynchronizing.")
+                self.escape_errors += 1
+                self._resync(start + 1)
+                continue
+            except LengthError as err:
+                self._logger.error(f"{err} Resynchronizing.")
+                self.length_errors += 1
+                self._resync(start + 1)
+                continue
+
+            self._position = start + 1 + stuffed_length
+            if not _verify(data):
+                self._logger.error("Invalid checksum. Discarding message.")
+                self.checksum_errors += 1
+                continue
+            self.frames_decoded += 1
+            return data
+        return None
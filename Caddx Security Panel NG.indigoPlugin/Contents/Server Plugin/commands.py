@@ -0,0 +1,338 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import capabilities
+import constants as const
+import metrics
+
+
+class CommandError(Exception):
+    """Base class for failed panel requests."""
+
+    def __init__(self, message: str, command: const.MessageType, response: tuple = None):
+        super().__init__(message)
+        self.command = command
+        self.response = response
+
+
+class CommandRejected(CommandError):
+    """The panel answered the request with Rejected or FailedRequest."""
+
+
+class CommandTimeout(CommandError):
+    """The panel did not answer the request, or kept answering NACK, after all retries."""
+
+
+class CommandQueueFull(CommandError):
+    """The command queue is at its depth limit and the request could not wait for room."""
+
+
+class CommandUnsupported(CommandError):
+    """The panel's interface configuration does not enable the request, so it was not sent."""
+
+
+# Unsupported request -> (request reading the same state in less detail, its message data from the original's).
+# A Zone Status request becomes the Zones Snapshot holding the zone; snapshots for nearby zones merge in the queue.
+FALLBACKS = {
+    const.MessageType.ZoneStatusReq: (const.MessageType.ZonesSnapshotReq, lambda data: bytearray([data[0] // 16])),
+}
+
+
+class PendingCommand:
+    __slots__ = ("info", "message_data", "priority", "future", "attempts", "deadline", "sent_at")
+
+    def __init__(self, info: const.CommandInfo, message_data: bytearray | None, priority: const.CommandPriority):
+        self.info = info
+        self.message_data = message_data
+        self.priority = priority
+        self.future = Future()
+        self.attempts = 0
+        self.deadline = 0.0
+        self.sent_at = 0.0
+
+    @property
+    def key(self) -> tuple:
+        return self.info.command, bytes(self.message_data or b"")
+
+    def matches(self, message_type: const.MessageType, message: tuple) -> bool:
+        """
+        Check whether a received message answers this request.
+        :param message_type: Received message type, with the ack-request bits stripped.
+        :param message: The decoded message.
+        :return: True if the message is the response to this request.
+        """
+        if message_type not in self.info.valid_response:
+            return False
+        if self.info.command in const.IndexedRequests and message_type != const.MessageType.ACK:
+            return message[0] == self.message_data[0]  # Zone, partition or event number is the first field
+        return True
+
+
+class CommandEngine:
+    """
+    Request/response correlation for commands sent to the panel.
+
+    The panel handles one request at a time, so commands are sent one by one from per-priority queues: every
+    Interactive command goes before any Normal one, and every Normal one before any Background one. Identical
+    Normal/Background requests that are still queued are merged and share one future. Each sent command
+    waits for one of the responses listed for it in const.CommandTable, is retried on NACK or silence up to
+    const.COMMAND_RETRIES times, and fails with CommandRejected on Rejected/FailedRequest. The next command is
+    sent as soon as the current one completes, so the link never idles while work is queued and a lost response
+    never blocks the queue for longer than the command timeout.
+
+    Interactive commands are always accepted. Once max_queued commands are waiting, other submissions block the
+    calling thread until there is room (backpressure), or fail with CommandQueueFull if they cannot wait.
+
+    Once the panel's capabilities are known, requests it does not enable are never sent: they are replaced by
+    their entry in FALLBACKS if the panel supports that, and otherwise fail at once with CommandUnsupported.
+    Requests queued before the capabilities were known fail with CommandUnsupported when their turn comes.
+
+    While the link is down the loop stops polling and calls suspend(): the request in flight goes back to the head
+    of its queue and everything queued waits for the reconnect, unless the loop gives up on it with cancel_all().
+
+    submit() may be called from any thread. poll(), handle_message() and suspend() must be called from the
+    communication loop, which owns the serial connection; submissions from that thread never block.
+    """
+
+    def __init__(self, send: Callable[[const.MessageType, bytearray | None], None], wake: Callable[[], None] = None,
+                 logger: logging.Logger = None, retries: int = const.COMMAND_RETRIES,
+                 max_queued: int = const.MAX_QUEUED_COMMANDS):
+        self._send = send
+        self._wake = wake
+        self._logger = logger or logging.getLogger(__name__)
+        self._retries = retries
+        self._max_queued = max_queued
+        self._lock = threading.Condition()
+        self._queues = tuple(collections.deque() for _ in const.CommandPriority)
+        self._queued: dict[tuple, PendingCommand] = {}
+        self._current: PendingCommand | None = None
+        self._loop_thread = None
+        self.capabilities: capabilities.PanelCapabilities | None = None   # None until the panel reports them
+        self.frames_sent = 0
+        self.responses_received = 0
+        self.nacks = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.unsupported = 0
+        self.fallbacks = 0
+        self.high_water = 0
+        self.round_trips: dict[const.MessageType, metrics.Histogram] = collections.defaultdict(metrics.Histogram)
+
+    @property
+    def busy(self) -> bool:
+        return self._current is not None or any(self._queues)
+
+    @property
+    def depth(self) -> int:
+        return sum(len(q) for q in self._queues)
+
+    def supports(self, message_type: const.MessageType) -> bool:
+        """
+        :param message_type: A request type.
+        :return: False if the panel is known not to enable the request; True if it does or is not known yet.
+        """
+        return self.capabilities is None or self.capabilities.supports(message_type)
+
+    def submit(self, message_type: const.MessageType, message_data: bytearray = None,
+               callback: Callable[[Future], None] = None, priority: const.CommandPriority = None,
+               timeout: float = None, first: bool = False) -> Future:
+        """
+        Queue a request for the panel.
+
+        :param message_type: The request message type.
+        :param message_data: Ancillary message data, if used.
+        :param callback: Optional callable invoked with the future when the request completes.
+        :param priority: Overrides the default priority for the message type in const.CommandTable.
+        :param timeout: Longest time to wait for room in a full queue. None waits indefinitely, except on the
+            communication loop thread, which never waits.
+        :param first: Queue the request ahead of everything already queued at its priority.
+        :return: Future resolved with the decoded response message, or failed with a CommandError. A request
+            replaced by its fallback resolves with the fallback's response.
+        """
+        info = const.CommandTable.get(message_type)
+        if info is None:
+            raise ValueError(f"Unsupported command: {message_type!r}")
+        message_length = 1 + len(message_data) if message_data else 1
+        if message_length != info.length:
+            raise ValueError(f"Invalid message length for message type {message_type.name}. "
+                             f"Expected {info.length}, got {message_length}")
+        if not self.supports(message_type):
+            fallback, fallback_data = FALLBACKS.get(message_type, (None, None))
+            if fallback is None or not self.supports(fallback):
+                self.unsupported += 1
+                future = Future()
+                future.set_exception(CommandUnsupported(f"{message_type.name} is not enabled on the panel",
+                                                        message_type))
+                if callback:
+                    future.add_done_callback(callback)
+                return future
+            self.fallbacks += 1
+            message_type, message_data = fallback, fallback_data(message_data)
+            info = const.CommandTable[message_type]
+        pending = PendingCommand(info, message_data, info.priority if priority is None else priority)
+        with self._lock:
+            merged = self._queued.get(pending.key) if pending.priority != const.CommandPriority.Interactive else None
+            if merged is not None:
+                pending = merged
+                if priority is not None and priority < merged.priority:
+                    self._queues[merged.priority].remove(merged)
+                    merged.priority = priority
+                    self._queues[priority].append(merged)
+            else:
+                if pending.priority != const.CommandPriority.Interactive and self.depth >= self._max_queued:
+                    wait = threading.current_thread() is not self._loop_thread and (timeout is None or timeout > 0)
+                    if not wait or not self._lock.wait_for(lambda: self.depth < self._max_queued, timeout):
+                        raise CommandQueueFull(f"Command queue full; {message_type.name} not queued", message_type)
+                if first:
+                    self._queues[pending.priority].appendleft(pending)
+                else:
+                    self._queues[pending.priority].append(pending)
+                if pending.priority != const.CommandPriority.Interactive:
+                    self._queued[pending.key] = pending
+                self.high_water = max(self.high_water, self.depth)
+        if callback:
+            pending.future.add_done_callback(callback)
+        if self._wake:
+            self._wake()
+        return pending.future
+
+    def poll(self, now: float = None) -> float | None:
+        """
+        Expire the current request if its deadline has passed and send the next queued request if idle.
+
+        :param now: Current monotonic time, for callers that already have it.
+        :return: Seconds until the current request times out, or None if nothing is in flight.
+        """
+        self._loop_thread = threading.current_thread()
+        now = time.monotonic() if now is None else now
+        current = self._current
+        if current is not None and now >= current.deadline:
+            self.timeouts += 1
+            self._logger.warning(f"No response to {current.info.command.name} after {current.info.timeout:.1f}s")
+            self._retry_or_fail(current, CommandTimeout(f"No response to {current.info.command.name}",
+                                                        current.info.command), now)
+        if self._current is None:
+            self._send_next(now)
+        if self._current is None:
+            return None
+        return max(0.0, self._current.deadline - now)
+
+    def handle_message(self, message_type: const.MessageType, message: tuple) -> bool:
+        """
+        Match a received message against the request in flight.
+
+        :param message_type: Received message type, with the ack-request bits stripped.
+        :param message: The decoded message.
+        :return: True if the message was consumed as a response to the current request.
+        """
+        current = self._current
+        if current is None:
+            return False
+        now = time.monotonic()
+        if current.matches(message_type, message):
+            self.responses_received += 1
+            self.round_trips[current.info.command].observe(now - current.sent_at)
+            self._current = None
+            current.future.set_result(message)
+            self._send_next(now)
+            return True
+        if message_type == const.MessageType.NACK:
+            self.responses_received += 1
+            self.nacks += 1
+            self._logger.debug(f"{current.info.command.name} NACKed by panel")
+            self._retry_or_fail(current, CommandTimeout(f"{current.info.command.name} NACKed by panel",
+                                                        current.info.command, message), now)
+            return True
+        if message_type in (const.MessageType.Rejected, const.MessageType.FailedRequest):
+            self.responses_received += 1
+            self.rejected += 1
+            # A zone, partition or event the panel does not have is for the caller to judge, e.g. an unused log entry
+            failed_index = message_type == const.MessageType.FailedRequest and \
+                current.info.command in const.IndexedRequests
+            self._logger.log(logging.DEBUG if failed_index else logging.ERROR,
+                             f"{current.info.command.name} {message_type.name.lower()} by panel")
+            self._current = None
+            current.future.set_exception(CommandRejected(f"{current.info.command.name} {message_type.name}",
+                                                         current.info.command, message))
+            self._send_next(now)
+            return True
+        return False
+
+    def suspend(self) -> None:
+        """
+        Put the request in flight back at the head of its queue, with its attempts reset, because the link went
+        down before it was answered. It is sent again first when poll() is next called.
+        :return: None
+        """
+        current = self._current
+        if current is None:
+            return
+        self._current = None
+        current.attempts = 0
+        with self._lock:
+            self._queues[current.priority].appendleft(current)
+            if current.priority != const.CommandPriority.Interactive:
+                self._queued.setdefault(current.key, current)
+        self._logger.debug(f"{current.info.command.name} requeued until the link is back")
+
+    def cancel_all(self, reason: str) -> None:
+        """
+        Fail the request in flight and everything still queued.
+        :param reason: Text for the CommandError set on each future.
+        :return: None
+        """
+        with self._lock:
+            pending = [command for q in self._queues for command in q]
+            for q in self._queues:
+                q.clear()
+            self._queued.clear()
+            self._lock.notify_all()
+        if self._current is not None:
+            pending.insert(0, self._current)
+            self._current = None
+        for command in pending:
+            if not command.future.done():
+                command.future.set_exception(CommandError(reason, command.info.command))
+
+    def _retry_or_fail(self, current: PendingCommand, error: CommandError, now: float) -> None:
+        if current.attempts > self._retries:
+            self._current = None
+            current.future.set_exception(error)
+            self._send_next(now)
+            return
+        self._transmit(current, now)
+
+    def _send_next(self, now: float) -> None:
+        while self._current is None:
+            with self._lock:
+                pending = next((q.popleft() for q in self._queues if q), None)
+                if pending is None:
+                    return
+                if self._queued.get(pending.key) is pending:
+                    del self._queued[pending.key]
+                self._lock.notify()
+            # A request put back by suspend() was already running
+            if not pending.future.running() and not pending.future.set_running_or_notify_cancel():
+                continue
+            # Queued before the panel reported its capabilities
+            if not self.supports(pending.info.command):
+                self.unsupported += 1
+                pending.future.set_exception(CommandUnsupported(f"{pending.info.command.name} is not enabled on "
+                                                                f"the panel", pending.info.command))
+                continue
+            self._current = pending
+            self._transmit(pending, now)
+
+    def _transmit(self, pending: PendingCommand, now: float) -> None:
+        pending.attempts += 1
+        pending.sent_at = now
+        pending.deadline = now + pending.info.timeout
+        self.frames_sent += 1
+        self._send(pending.info.command, pending.message_data)
@@ -4,9 +4,23 @@ from types import MappingProxyType
 
 
 class PPK(Enum):
+    DEBUG = "debugMode"
+    CAPTURE = "serialCapture"
+    LOG_LEVEL_WIRE = "logLevelWire"
+    LOG_LEVEL_DECODE = "logLevelDecode"
+    LOG_LEVEL_STATE = "logLevelState"
+    LOG_LEVEL_QUEUE = "logLevelQueue"
+    FRAME_HISTORY = "frameHistory"
+    UPDATE_WINDOW = "stateUpdateWindow"
+
+
+class DPK(Enum):
     PORT = "serialPort"
     BAUD = "serialBaudRate"
-    DEBUG = "debugMode"
+    DETECTED_BAUD = "detectedBaudRate"
+    INTERFACE = "panelInterface"
+    ZONE_NUMBER = "zoneNumber"
+    PARTITION_NUMBER = "partitionNumber"
     PANEL_FIRMWARE = "panelFirmware"
     TRANSITION_MESSAGE_FLAGS1 = "transitionMessageFlags1"
     TRANSITION_MESSAGE_FLAGS2 = "transitionMessageFlags2"
@@ -16,6 +30,19 @@ class PPK(Enum):
     REQUEST_COMMAND_FLAGS4 = "requestCommandFlags4"
 
 
+class LogCategory(Enum):
+    WIRE = "wire"       # Frames sent and received, framing errors, ACKs
+    DECODE = "decode"   # Received message contents
+    STATE = "state"     # Indigo device state changes
+    QUEUE = "queue"     # Command queue, retries and startup sync
+
+
+class DeviceTypeId(Enum):
+    PANEL_INTERFACE = "panelInterface"
+    PARTITION = "partition"
+    ZONE = "zone"
+
+
 class MessageType(IntEnum):
     IntConfigRsp = 0x01,            # Interface Configuration (Response)
     ZoneNameRsp = 0x03,             # Zone Name (Response)
@@ -106,12 +133,73 @@ MessageValidLength = MappingProxyType(
     }
 )
 
+
+class CommandPriority(IntEnum):
+    Interactive = 0,    # User actions: arm/disarm, bypass, clock set. Always sent first.
+    Normal = 1,         # Interface configuration and partition/system status refreshes
+    Background = 2,     # Bulk refresh traffic. Duplicates are merged and queue depth is bounded.
+
+
 CommandInfo = NamedTuple('CaddxCommand', [
     ('command', MessageType),
     ('length', int),
     ('valid_response', Set[MessageType]),
+    ('timeout', float),
+    ('priority', CommandPriority),
 ])
 
+# Responses that end a request unsuccessfully, in addition to the positive responses in CommandInfo.valid_response
+NegativeResponses = frozenset({MessageType.NACK, MessageType.Rejected, MessageType.FailedRequest})
+
+# Requests whose first data byte (zone, partition or event number) is echoed in the first data byte of the response
+IndexedRequests = frozenset({
+    MessageType.ZoneNameReq,
+    MessageType.ZoneStatusReq,
+    MessageType.ZonesSnapshotReq,
+    MessageType.PartitionStatusReq,
+    MessageType.LogEventReq,
+})
+
+DEFAULT_COMMAND_TIMEOUT = 2.0   # Seconds to wait for a response before retrying
+COMMAND_RETRIES = 2             # Retries after the first attempt on NACK or no response
+MAX_QUEUED_COMMANDS = 64        # Queue depth above which Normal and Background submissions are refused or block
+
+
+def _command(command: MessageType, *valid_response: MessageType, timeout: float = DEFAULT_COMMAND_TIMEOUT,
+             priority: CommandPriority = CommandPriority.Normal) -> CommandInfo:
+    return CommandInfo(command, MessageValidLength[command], frozenset(valid_response), timeout, priority)
+
+
+CommandTable = MappingProxyType({
+    info.command: info for info in (
+        _command(MessageType.IntConfigReq, MessageType.IntConfigRsp),
+        _command(MessageType.ZoneNameReq, MessageType.ZoneNameRsp, priority=CommandPriority.Background),
+        _command(MessageType.ZoneStatusReq, MessageType.ZoneStatusRsp, priority=CommandPriority.Background),
+        _command(MessageType.ZonesSnapshotReq, MessageType.ZonesSnapshotRsp, priority=CommandPriority.Background),
+        _command(MessageType.PartitionStatusReq, MessageType.PartitionStatusRsp),
+        _command(MessageType.PartitionSnapshotReq, MessageType.PartitionSnapshotRsp),
+        _command(MessageType.SystemStatusReq, MessageType.SystemStatusRsp),
+        _command(MessageType.X10MessageReq, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.LogEventReq, MessageType.LogEventInd, priority=CommandPriority.Background),
+        _command(MessageType.KeypadTextMsgReq, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.KeypadTerminalModeReq, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.ProgramDataReq, MessageType.ProgramDataRsp, timeout=4.0,
+                 priority=CommandPriority.Background),
+        _command(MessageType.ProgramDataCmd, MessageType.ACK, timeout=4.0, priority=CommandPriority.Interactive),
+        _command(MessageType.UserInfoReqPin, MessageType.UserInfoRsp, priority=CommandPriority.Background),
+        _command(MessageType.UserInfoReqNoPin, MessageType.UserInfoRsp, priority=CommandPriority.Background),
+        _command(MessageType.SetUserCodePin, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.SetUserCodeNoPin, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.SetUserAuthorityPin, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.SetUserAuthorityNoPin, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.SetClockCalendar, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.PrimaryKeypadFuncPin, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.PrimaryKeypadFuncNoPin, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.SecondaryKeypadFunc, MessageType.ACK, priority=CommandPriority.Interactive),
+        _command(MessageType.ZoneBypassToggle, MessageType.ACK, priority=CommandPriority.Interactive),
+    )
+})
+
 
 # Interface Configuration (Response) constants
 class TransitionMessageFlags1(IntEnum):
@@ -163,3 +251,150 @@ class RequestCommandFlags4(IntEnum):
     PrimaryKeypadNoPin = 0b00100000,    # Primary Keypad Function without PIN
     SecondaryKeypad = 0b01000000,       # Secondary Keypad Function
     ZoneBypassToggle = 0b10000000,      # Zone Bypass Toggle
+
+
+# Message type -> (byte of the transition message flags, bit) that makes the panel send it on every change
+TransitionFlags = MappingProxyType({
+    MessageType.IntConfigRsp: (0, TransitionMessageFlags1.InterfaceConfig),
+    MessageType.ZoneStatusRsp: (0, TransitionMessageFlags1.ZoneStatus),
+    MessageType.ZonesSnapshotRsp: (0, TransitionMessageFlags1.ZoneSnapshot),
+    MessageType.PartitionStatusRsp: (0, TransitionMessageFlags1.PartitionStatus),
+    MessageType.PartitionSnapshotRsp: (0, TransitionMessageFlags1.PartitionSnapshot),
+    MessageType.SystemStatusRsp: (1, TransitionMessageFlags2.SystemStatus),
+    MessageType.X10MessageInd: (1, TransitionMessageFlags2.X10Message),
+    MessageType.LogEventInd: (1, TransitionMessageFlags2.LogEvent),
+    MessageType.KeypadButtonInd: (1, TransitionMessageFlags2.KeypadButton),
+})
+
+# Request type -> (byte of the request command flags, bit) that enables it
+RequestFlags = MappingProxyType({
+    MessageType.IntConfigReq: (0, RequestCommandFlags1.InterfaceConfig),
+    MessageType.ZoneNameReq: (0, RequestCommandFlags1.ZoneName),
+    MessageType.ZoneStatusReq: (0, RequestCommandFlags1.ZoneStatus),
+    MessageType.ZonesSnapshotReq: (0, RequestCommandFlags1.ZoneSnapshot),
+    MessageType.PartitionStatusReq: (0, RequestCommandFlags1.PartitionStatus),
+    MessageType.PartitionSnapshotReq: (0, RequestCommandFlags1.PartitionSnapshot),
+    MessageType.SystemStatusReq: (1, RequestCommandFlags2.SystemStatus),
+    MessageType.X10MessageReq: (1, RequestCommandFlags2.X10Message),
+    MessageType.LogEventReq: (1, RequestCommandFlags2.LogEvent),
+    MessageType.KeypadTextMsgReq: (1, RequestCommandFlags2.KeypadTextMessage),
+    MessageType.KeypadTerminalModeReq: (1, RequestCommandFlags2.KeypadTerminalMode),
+    MessageType.ProgramDataReq: (2, RequestCommandFlags3.ProgramData),
+    MessageType.ProgramDataCmd: (2, RequestCommandFlags3.ProgramDataCommand),
+    MessageType.UserInfoReqPin: (2, RequestCommandFlags3.UserInfoPin),
+    MessageType.UserInfoReqNoPin: (2, RequestCommandFlags3.UserInfoNoPin),
+    MessageType.SetUserCodePin: (2, RequestCommandFlags3.SetUserCodePin),
+    MessageType.SetUserCodeNoPin: (2, RequestCommandFlags3.SetUserCodeNoPin),
+    MessageType.SetUserAuthorityPin: (2, RequestCommandFlags3.SetUserAuthorityPin),
+    MessageType.SetUserAuthorityNoPin: (2, RequestCommandFlags3.SetUserAuthorityNoPin),
+    MessageType.SetClockCalendar: (3, RequestCommandFlags4.SetClockCalendar),
+    MessageType.PrimaryKeypadFuncPin: (3, RequestCommandFlags4.PrimaryKeypadPin),
+    MessageType.PrimaryKeypadFuncNoPin: (3, RequestCommandFlags4.PrimaryKeypadNoPin),
+    MessageType.SecondaryKeypadFunc: (3, RequestCommandFlags4.SecondaryKeypad),
+    MessageType.ZoneBypassToggle: (3, RequestCommandFlags4.ZoneBypassToggle),
+})
+
+# Messages the plugin cannot work without. Zone status can be read with either per-zone or snapshot requests,
+# so those two are required as a group.
+RequiredTransitions = frozenset({
+    MessageType.IntConfigRsp,
+    MessageType.ZoneStatusRsp,
+    MessageType.PartitionStatusRsp,
+    MessageType.PartitionSnapshotRsp,
+    MessageType.SystemStatusRsp,
+})
+RequiredRequests = frozenset({
+    MessageType.IntConfigReq,
+    MessageType.PartitionStatusReq,
+    MessageType.PartitionSnapshotReq,
+    MessageType.SystemStatusReq,
+    MessageType.SetClockCalendar,
+    MessageType.PrimaryKeypadFuncNoPin,
+})
+RequiredRequestGroups = (frozenset({MessageType.ZoneStatusReq, MessageType.ZonesSnapshotReq}),)
+
+
+# Log Event (Indication) event types, bits 0-6 of the event type byte
+class LogEventType(IntEnum):
+    Alarm = 0
+    AlarmRestore = 1
+    Bypass = 2
+    BypassRestore = 3
+    Tamper = 4
+    TamperRestore = 5
+    Trouble = 6
+    TroubleRestore = 7
+    TxLowBattery = 8
+    TxLowBatteryRestore = 9
+    ZoneLost = 10
+    ZoneLostRestore = 11
+    StartOfCrossTime = 12
+    SpecialExpansionEvent = 17
+    Duress = 18
+    ManualFire = 19
+    Auxiliary2Panic = 20
+    Panic = 22
+    KeypadTamper = 23
+    ControlBoxTamper = 24
+    ControlBoxTamperRestore = 25
+    AcFail = 26
+    AcFailRestore = 27
+    LowBattery = 28
+    LowBatteryRestore = 29
+    OverCurrent = 30
+    OverCurrentRestore = 31
+    SirenTamper = 32
+    SirenTamperRestore = 33
+    TelephoneFault = 34
+    TelephoneFaultRestore = 35
+    ExpanderTrouble = 36
+    ExpanderTroubleRestore = 37
+    FailToCommunicate = 38
+    LogFull = 39
+    Opening = 40
+    Closing = 41
+    ExitError = 42
+    RecentClosing = 43
+    AutoTest = 44
+    StartProgram = 45
+    EndProgram = 46
+    StartDownload = 47
+    EndDownload = 48
+    Cancel = 49
+    GroundFault = 50
+    GroundFaultRestore = 51
+    ManualTest = 52
+    ClosedWithZonesBypassed = 53
+    StartOfListenIn = 54
+    TechnicianOnSite = 55
+    TechnicianLeft = 56
+    ControlPowerUp = 57
+    FirstToOpen = 119
+    LastToClose = 120
+    PinEnteredWithBit7Set = 121
+    BeginWalkTest = 122
+    EndWalkTest = 123
+    ReExit = 124
+    OutputTrip = 125
+    DataLost = 126
+
+
+# What the zone/user/device byte of a log event refers to; other event types leave it unused
+LogEventZoneTypes = frozenset(LogEventType(value) for value in range(LogEventType.Alarm,
+                                                                     LogEventType.StartOfCrossTime + 1))
+LogEventUserTypes = frozenset({
+    LogEventType.Duress,
+    LogEventType.Opening,
+    LogEventType.Closing,
+    LogEventType.RecentClosing,
+    LogEventType.Cancel,
+    LogEventType.ClosedWithZonesBypassed,
+    LogEventType.FirstToOpen,
+    LogEventType.LastToClose,
+    LogEventType.PinEnteredWithBit7Set,
+})
+LogEventDeviceTypes = frozenset({
+    LogEventType.KeypadTamper,
+    LogEventType.ExpanderTrouble,
+    LogEventType.ExpanderTroubleRestore,
+})
@@ -0,0 +1,377 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import commands
+import constants as const
+import messages
+
+MAGIC = b"CDXEVT1\n"
+_RECORD = struct.Struct("<I4B")  # Event time, event number, event type, zone/user/device, partition
+
+CLOCK_SKEW = 86400  # Seconds the panel clock may run ahead before an event is taken to be from last year
+READ_CHUNK = 512    # Records read at a time when scanning the history
+
+
+class EventRecord(NamedTuple):
+    timestamp: int          # Panel clock time of the event, in seconds since the epoch
+    event_number: int       # Position of the event in the panel's circular log
+    event_type: int         # Event type byte; bits 0-6 are a const.LogEventType
+    number: int             # Zone, user or device the event refers to, as reported by the panel
+    partition: int          # Partition, as reported by the panel (0 is partition 1)
+
+    @property
+    def type(self) -> const.LogEventType | None:
+        try:
+            return const.LogEventType(self.event_type & 0x7f)
+        except ValueError:
+            return None
+
+    def describe(self) -> str:
+        """
+        :return: One line description, e.g. "2026-10-17 08:15 Opening, user 3, partition 1".
+        """
+        event_type = self.type
+        name = event_type.name if event_type is not None else f"Event type {self.event_type & 0x7f}"
+        if event_type in const.LogEventZoneTypes:
+            name += f", zone {self.number + 1}"
+        elif event_type in const.LogEventUserTypes:
+            name += f", user {self.number}"
+        elif event_type in const.LogEventDeviceTypes:
+            name += f", device {self.number}"
+        return f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(self.timestamp))} {name}, " \
+               f"partition {self.partition + 1}"
+
+
+def record_from_message(message: messages.LogEventInd, now: float = None) -> EventRecord | None:
+    """
+    Convert a Log Event message. The panel logs month, day and time but no year; the event is placed in the most
+    recent year that does not put it in the future.
+    :param message: The decoded message.
+    :param now: Current time, for tests and replays.
+    :return: The record, or None if the slot holds no valid date (an unused log entry).
+    """
+    now = time.time() if now is None else now
+    year = time.localtime(now).tm_year
+    for year in (year, year - 1):
+        try:
+            timestamp = int(datetime.datetime(year, message.month, message.day, message.hour,
+                                              message.minute).timestamp())
+        except ValueError:
+            continue  # Invalid date, or 29 February outside a leap year
+        if timestamp <= now + CLOCK_SKEW:
+            return EventRecord(timestamp, message.event_number, message.event_type, message.zone_user_device,
+                               message.partition)
+    return None
+
+
+class EventHistory:
+    """
+    Append-only file of panel log events, oldest first.
+
+    The file is an 8 byte header followed by fixed 8 byte records (event time, event number, type, zone/user/device
+    and partition), so a few hundred thousand events fit in a couple of megabytes. Events are appended in the
+    order the panel logged them, so times only go backwards if the panel clock is set back; a time range query
+    finds its first record with a binary search over the file and reads forward from there, without loading the
+    rest. The last record is the high-water mark the next download starts from.
+    """
+
+    def __init__(self, path: str, logger: logging.Logger = None):
+        self._path = path
+        self._logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.last: EventRecord | None = None
+        self.count = 0
+        self._open()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _open(self) -> None:
+        """
+        Check the file and read its last record. A file that is not an event history is moved aside; a record cut
+        short by a crash is truncated.
+        """
+        try:
+            size = os.path.getsize(self._path)
+        except OSError:
+            return
+        try:
+            with open(self._path, "rb") as history_file:
+                if history_file.read(len(MAGIC)) != MAGIC:
+                    self._logger.warning(f"'{self._path}' is not an event history; starting a new one")
+                    os.replace(self._path, f"{self._path}.bad")
+                    return
+                self.count = (size - len(MAGIC)) // _RECORD.size
+                if self.count:
+                    history_file.seek(len(MAGIC) + (self.count - 1) * _RECORD.size)
+                    self.last = EventRecord(*_RECORD.unpack(history_file.read(_RECORD.size)))
+            if len(MAGIC) + self.count * _RECORD.size != size:
+                os.truncate(self._path, len(MAGIC) + self.count * _RECORD.size)
+        except OSError as err:
+            self._logger.error(f"Unable to read event history '{self._path}': {err}")
+
+    def append(self, records: Iterable[EventRecord]) -> int:
+        """
+        Append events to the end of the history.
+        :param records: Events, oldest first.
+        :return: Number of events written.
+        """
+        data = bytearray()
+        last = None
+        for last in records:
+            data += _RECORD.pack(*last)
+        if last is None:
+            return 0
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+                with open(self._path, "ab") as history_file:
+                    if history_file.tell() == 0:
+                        history_file.write(MAGIC)
+                    history_file.write(data)
+            except OSError as err:
+                self._logger.error(f"Unable to write event history '{self._path}': {err}")
+                return 0
+            self.last = last
+            self.count += len(data) // _RECORD.size
+        return len(data) // _RECORD.size
+
+    def query(self, start: float = None, end: float = None) -> Iterator[EventRecord]:
+        """
+        Read the events logged in a time range.
+        :param start: Earliest event time, or None for the beginning of the history.
+        :param end: Event time the range stops before, or None for the end of the history.
+        :return: Iterator of events, oldest first.
+        """
+        try:
+            history_file = open(self._path, "rb")
+        except FileNotFoundError:
+            return
+        with history_file:
+            count = self.count
+            low, high = 0, count
+            while start is not None and low < high:
+                middle = (low + high) // 2
+                history_file.seek(len(MAGIC) + middle * _RECORD.size)
+                if _RECORD.unpack(history_file.read(_RECORD.size))[0] < start:
+                    low = middle + 1
+                else:
+                    high = middle
+            history_file.seek(len(MAGIC) + low * _RECORD.size)
+            while low < count:
+                chunk = history_file.read(min(READ_CHUNK, count - low) * _RECORD.size)
+                if not chunk:
+                    return
+                for fields in _RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % _RECORD.size]):
+                    if end is not None and fields[0] >= end:
+                        return
+                    yield EventRecord(*fields)
+                low += len(chunk) // _RECORD.size
+
+
+class EventLogSync:
+    """
+    Brings the event history up to date with the panel's circular event log, reading as few entries as possible.
+
+    The last event in the history is the high-water mark. start() reads back the log entry at its event number:
+    if the panel still holds that event, the entries after it are read one at a time until one is older than the
+    mark (a slot the log has not reached since it last wrapped) or is unused, and only those are appended. If the
+    entry was overwritten, the log has wrapped all the way past the mark (or was cleared) while the plugin was
+    stopped, so every event it holds is new: the whole log is read once, put in order and appended. The same
+    full read fills an empty history.
+
+    Between downloads, Log Event transitions from the panel are appended as they arrive, and one that skips an
+    event number starts a catch up read. Requests are sent at background priority and one at a time, so a
+    download never delays status traffic. Callbacks run on the communication loop thread.
+    """
+
+    def __init__(self, engine: commands.CommandEngine, history: EventHistory, logger: logging.Logger = None,
+                 on_record: Callable[[EventRecord, bool], None] = None):
+        """
+        :param engine: Command engine of the connection.
+        :param history: History to append to.
+        :param logger: Logger for progress messages.
+        :param on_record: Called with each appended event, and whether it arrived as a live transition.
+        """
+        self._engine = engine
+        self._history = history
+        self._logger = logger or logging.getLogger(__name__)
+        self._on_record = on_record
+        self._stage = 0             # 0 idle, 1 checking the high-water mark, 2 reading new entries, 3 reading all
+        self._started = False
+        self._missed = False        # A transition arrived during a download, which may have finished before it
+        self._requested = 0
+        self._pending: Future | None = None     # Future of the request the download is waiting for
+        self._log_size = 0
+        self._entries: list[EventRecord | None] = []
+        self._download_started = 0.0
+        self.requests = 0
+        self.appended = 0
+
+    @property
+    def running(self) -> bool:
+        return self._stage != 0
+
+    def start(self) -> None:
+        """
+        Download the events logged since the high-water mark. Must be called from the communication loop thread.
+        :return: None
+        """
+        self._started = True
+        if self.running:
+            return
+        if not self._engine.supports(const.MessageType.LogEventReq):
+            self._logger.debug("Event log requests are not enabled on the panel; only transitions are recorded")
+            return
+        self._download_started = time.monotonic()
+        self.requests = 0
+        self.appended = 0
+        last = self._history.last
+        if last is None:
+            self._logger.info("Reading the panel event log")
+            self._read_all()
+        else:
+            self._stage = 1
+            self._request(last.event_number)
+
+    def cancel(self) -> None:
+        """
+        Abandon a download; completions of requests already queued are ignored.
+        :return: None
+        """
+        self._stage = 0
+        self._started = False
+        self._pending = None
+
+    def indication(self, message: messages.LogEventInd) -> None:
+        """
+        Handle a Log Event message from the panel. Responses to this class's own requests are handled by their
+        completion callbacks, so messages received during a download are left to it.
+        :param message: The decoded message.
+        :return: None
+        """
+        if not self._started:
+            return  # The download at start() will read it from the log
+        if self.running:
+            if message.event_number != self._requested:
+                self._missed = True
+            return
+        last = self._history.last
+        record = record_from_message(message)
+        if record is None or last is None or record == last:
+            return
+        self._log_size = message.log_size or self._log_size
+        if message.event_number == self._following(last.event_number) and record.timestamp >= last.timestamp:
+            self._append([record], live=True)
+        else:
+            self._logger.debug(f"Event log: event {message.event_number} does not follow {last.event_number}, "
+                               f"reading the events in between")
+            self._download_started = time.monotonic()
+            self._stage = 2
+            self._request(self._following(last.event_number))
+
+    def _following(self, event_number: int) -> int:
+        return (event_number + 1) % self._log_size if self._log_size else event_number + 1
+
+    def _request(self, event_number: int) -> None:
+        self._requested = event_number
+        self.requests += 1
+        try:
+            self._pending = self._engine.submit(const.MessageType.LogEventReq, bytearray([event_number]),
+                                                callback=self._response)
+        except commands.CommandQueueFull as err:
+            self._logger.warning(f"Event log: {err}")
+            self._finish()
+
+    def _response(self, future: Future) -> None:
+        # A request requeued across a reconnect can be merged into by a new download, so its future completes the
+        # callbacks of both; only the first for the request the download is waiting for counts
+        if not self.running or future is not self._pending:
+            return
+        self._pending = None
+        error = future.exception()
+        if error is not None and not isinstance(error, commands.CommandRejected):
+            self._logger.warning(f"Event log download stopped: {error}")
+            self._finish()
+            return
+        # A rejected request (Failed Request) is an unused log entry
+        message: messages.LogEventInd | None = future.result() if error is None else None
+        record = record_from_message(message) if message is not None else None
+        if message is not None:
+            self._log_size = message.log_size or self._log_size
+        last = self._history.last
+
+        if self._stage == 1:
+            if record == last:
+                self._stage = 2
+                self._request(self._following(last.event_number))
+            else:
+                self._logger.info("The panel event log wrapped since it was last read; reading all of it")
+                self._read_all()
+        elif self._stage == 2:
+            if record is None or record.timestamp < last.timestamp or record == last:
+                self._finish()
+                return
+            self._append([record], live=False)
+            if self.requests <= self._log_size:
+                self._request(self._following(record.event_number))
+            else:
+                self._finish()
+        elif self._stage == 3:
+            self._entries.append(record)
+            # The log fills from entry 0, so an unused entry means it has not wrapped yet and the rest are unused
+            if message is not None and len(self._entries) < self._log_size:
+                self._request(len(self._entries))
+            else:
+                self._append(self._in_log_order(self._entries), live=False)
+                self._entries = []
+                self._finish()
+
+    def _read_all(self) -> None:
+        self._stage = 3
+        self._entries = []
+        self._request(0)
+
+    @staticmethod
+    def _in_log_order(entries: list[EventRecord | None]) -> list[EventRecord]:
+        """
+        Put the entries of a full log read in the order they were logged: the oldest follows the newest, which is
+        the first entry followed by an older one.
+        :param entries: Entries by event number, None for unused ones.
+        :return: Events, oldest first.
+        """
+        records = [record for record in entries if record is not None]
+        start = next((index + 1 for index in range(len(records) - 1)
+                      if records[index + 1].timestamp < records[index].timestamp), 0)
+        return records[start:] + records[:start]
+
+    def _append(self, records: list[EventRecord], live: bool) -> None:
+        if not self._history.append(records):
+            return
+        self.appended += len(records)
+        if self._on_record:
+            for record in records:
+                self._on_record(record, live)
+
+    def _finish(self) -> None:
+        self._stage = 0
+        self._pending = None
+        if self.appended:
+            self._logger.info(f"Event log: {self.appended} new event(s) in {self.requests} request(s), "
+                              f"{time.monotonic() - self._download_started:.1f}s")
+            self.appended = 0
+        self.requests = 0
+        if self._missed:
+            # Transitions ignored during the download may be newer than where it stopped
+            self._missed = False
+            self.start()
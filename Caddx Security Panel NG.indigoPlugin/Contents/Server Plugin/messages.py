@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+from types import MappingProxyType
+from typing import NamedTuple
+
+import constants as const
+
+
+class IntConfigRsp(NamedTuple):
+    firmware: bytes
+    transition_message_flags1: int
+    transition_message_flags2: int
+    request_command_flags1: int
+    request_command_flags2: int
+    request_command_flags3: int
+    request_command_flags4: int
+
+
+class ZoneNameRsp(NamedTuple):
+    zone: int                   # Zone number, 0-based
+    name: bytes
+
+
+class ZoneStatusRsp(NamedTuple):
+    zone: int                   # Zone number, 0-based
+    partition_mask: int
+    type_flags1: int
+    type_flags2: int
+    type_flags3: int
+    condition_flags1: int
+    condition_flags2: int
+
+
+class ZonesSnapshotRsp(NamedTuple):
+    offset: int                 # Block of 16 zones, 0 = zones 1-16
+    zones: bytes                # One nibble per zone, low nibble first
+
+
+class PartitionStatusRsp(NamedTuple):
+    partition: int              # Partition number, 0-based
+    condition_flags1: int
+    condition_flags2: int
+    condition_flags3: int
+    last_user: int
+    condition_flags4: int
+    condition_flags5: int
+    condition_flags6: int
+
+
+class PartitionSnapshotRsp(NamedTuple):
+    partitions: bytes           # One byte per partition
+
+
+class SystemStatusRsp(NamedTuple):
+    panel_id: int
+    flags1: int
+    flags2: int
+    flags3: int
+    flags4: int
+    flags5: int
+    flags6: int
+    flags7: int
+    flags8: int
+    valid_partitions: int
+    communicator_stack_pointer: int
+
+
+class X10MessageInd(NamedTuple):
+    house_code: int
+    unit_code: int
+    function: int
+
+
+class LogEventInd(NamedTuple):
+    event_number: int
+    log_size: int
+    event_type: int
+    zone_user_device: int
+    partition: int
+    month: int
+    day: int
+    hour: int
+    minute: int
+
+
+class KeypadButtonInd(NamedTuple):
+    key: int
+    keypad_address: int
+
+
+class ProgramDataRsp(NamedTuple):
+    bus_address: int
+    location_high: int
+    location_low: int
+    data_type: int
+    data: bytes
+
+    @property
+    def location(self) -> int:
+        return ((self.location_high & 0x0f) << 8) | self.location_low
+
+
+class UserInfoRsp(NamedTuple):
+    user_number: int
+    pin: bytes
+    data: bytes
+
+
+class EmptyRsp(NamedTuple):
+    """FailedRequest, ACK, NACK and Rejected carry no data."""
+
+
+class MessageLayout(NamedTuple):
+    layout: struct.Struct       # Field layout starting after the message type byte
+    factory: type
+
+
+def _layout(fmt: str, factory: type) -> MessageLayout:
+    return MessageLayout(struct.Struct("<" + fmt), factory)
+
+
+# Decoders for every message the panel sends, keyed by message type
+MessageLayouts = MappingProxyType({
+    const.MessageType.IntConfigRsp: _layout("4s6B", IntConfigRsp),
+    const.MessageType.ZoneNameRsp: _layout("B16s", ZoneNameRsp),
+    const.MessageType.ZoneStatusRsp: _layout("7B", ZoneStatusRsp),
+    const.MessageType.ZonesSnapshotRsp: _layout("B8s", ZonesSnapshotRsp),
+    const.MessageType.PartitionStatusRsp: _layout("8B", PartitionStatusRsp),
+    const.MessageType.PartitionSnapshotRsp: _layout("8s", PartitionSnapshotRsp),
+    const.MessageType.SystemStatusRsp: _layout("11B", SystemStatusRsp),
+    const.MessageType.X10MessageInd: _layout("3B", X10MessageInd),
+    const.MessageType.LogEventInd: _layout("9B", LogEventInd),
+    const.MessageType.KeypadButtonInd: _layout("2B", KeypadButtonInd),
+    const.MessageType.ProgramDataRsp: _layout("4B8s", ProgramDataRsp),
+    const.MessageType.UserInfoRsp: _layout("B3s12s", UserInfoRsp),
+    const.MessageType.FailedRequest: _layout("", EmptyRsp),
+    const.MessageType.ACK: _layout("", EmptyRsp),
+    const.MessageType.NACK: _layout("", EmptyRsp),
+    const.MessageType.Rejected: _layout("", EmptyRsp),
+})
+
+
+def decode(message_type: const.MessageType, message: bytes | bytearray | memoryview) -> tuple | None:
+    """
+    Decode a received message into its typed message object.
+
+    Fields are unpacked straight from the receive buffer with a precompiled struct layout; the buffer is not
+    sliced or copied.
+    :param message_type: Message type, with the ack-request bits stripped.
+    :param message: The received message, starting from command byte.
+    :return: Typed message, or None if there is no layout for the type or the message is too short.
+    """
+    entry = MessageLayouts.get(message_type)
+    if entry is None or len(message) < entry.layout.size + 1:
+        return None
+    return entry.factory._make(entry.layout.unpack_from(message, 1))
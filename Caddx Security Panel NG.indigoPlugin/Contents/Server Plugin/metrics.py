@@ -0,0 +1,256 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+import collections
+import time
+
+import constants as const
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; a final bucket catches everything slower
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Recording a sample is a bisect and three additions, cheap enough for every
+    frame; percentiles are reported as the upper bound of the bucket they fall in.
+    """
+
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def observe(self, seconds: float) -> None:
+        milliseconds = seconds * 1000.0
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.maximum:
+            self.maximum = milliseconds
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """
+        :param fraction: Percentile as a fraction, e.g. 0.95.
+        :return: Upper bound in milliseconds of the bucket holding the percentile, capped at the maximum.
+        """
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(float(LATENCY_BUCKETS_MS[index]), self.maximum) \
+                    if index < len(LATENCY_BUCKETS_MS) else self.maximum
+        return self.maximum
+
+    def summary(self) -> str:
+        return (f"n={self.count} avg={self.average:.1f}ms p50<={self.percentile(0.5):.0f}ms "
+                f"p95<={self.percentile(0.95):.0f}ms max={self.maximum:.1f}ms")
+
+
+# Counter state ids, in report order
+COUNTERS = ("framesIn", "bytesIn", "framesOut", "bytesOut", "acksIn", "acksOut", "nacksIn", "checksumErrors",
+            "escapeErrors", "lengthErrors", "resyncs", "discardedBytes", "retransmissionsDropped", "unknownMessages",
+            "commandsSent", "commandsRejected", "commandTimeouts")
+
+
+class LinkMetrics:
+    """
+    Health of the serial link: traffic and framing error counters, command round trips and queue depths.
+
+    The reader, frame decoder and command engine keep their own plain counters; this class adds the dispatcher's
+    and reads the others from the components attached for the current connection. Counters of replaced
+    components are folded into the totals when new ones are attached, so totals cover the whole plugin run; queue
+    depths and round-trip times describe the current command engine, which is kept across reconnects.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.messages_in = collections.Counter()    # MessageType -> count
+        self.unknown_messages = 0
+        self.dispatch = Histogram()                 # Time spent processing each received message
+        self.event_queue_high_water = 0
+        self._reader = None
+        self._engine = None
+        self.batcher = None                         # batcher.UpdateBatcher writing the device states
+        self.link_up = False
+        self.baud_rate = 0
+        self.throughput = 0.0                       # Bytes/s measured by the last link probe; 0 if not probed
+        self.reconnects = 0                         # Connections opened after the first one
+        self.link_down_seconds = 0.0                # Time spent reconnecting, excluding the current outage
+        self._down_since: float | None = None
+        self._previous = collections.Counter()      # Component counters of earlier connections
+        self._published: dict[str, object] = {}
+
+    def attach(self, serial_reader, engine) -> None:
+        """
+        Read component counters from a new connection's reader and command engine.
+        :param serial_reader: reader.SerialReader of the connection.
+        :param engine: commands.CommandEngine of the connection; the same engine when it is kept across a
+            reconnect.
+        :return: None
+        """
+        if serial_reader is not self._reader:
+            self._previous.update(self._reader_counters())
+            self._reader = serial_reader
+        if engine is not self._engine:
+            self._previous.update(self._engine_counters())
+            self._engine = engine
+
+    def record_link(self, up: bool) -> None:
+        """
+        Record the link coming up, after the serial port is opened, or going down.
+        :param up: True if the link came up.
+        :return: None
+        """
+        now = time.monotonic()
+        if up and not self.link_up:
+            if self._down_since is not None:
+                self.reconnects += 1
+                self.link_down_seconds += now - self._down_since
+                self._down_since = None
+        elif not up and self.link_up:
+            self._down_since = now
+        self.link_up = up
+
+    @property
+    def down_time(self) -> float:
+        """
+        :return: Seconds spent reconnecting, including the current outage.
+        """
+        if self._down_since is None:
+            return self.link_down_seconds
+        return self.link_down_seconds + time.monotonic() - self._down_since
+
+    def record_sent(self, frame_length: int) -> None:
+        self.frames_out += 1
+        self.bytes_out += frame_length
+
+    def record_dispatch(self, message_type: const.MessageType | None, seconds: float, queue_depth: int) -> None:
+        """
+        Record one received message handled by the communication loop.
+        :param message_type: Message type, or None if it was not recognized.
+        :param seconds: Time taken to process it.
+        :param queue_depth: Events still waiting in the loop's queue.
+        :return: None
+        """
+        if message_type is None:
+            self.unknown_messages += 1
+        else:
+            self.messages_in[message_type] += 1
+        self.dispatch.observe(seconds)
+        if queue_depth > self.event_queue_high_water:
+            self.event_queue_high_water = queue_depth
+
+    def _reader_counters(self) -> collections.Counter:
+        counters = collections.Counter()
+        if self._reader is not None:
+            decoder = self._reader.decoder
+            counters.update(framesIn=decoder.frames_decoded, bytesIn=decoder.bytes_received,
+                            checksumErrors=decoder.checksum_errors, escapeErrors=decoder.escape_errors,
+                            lengthErrors=decoder.length_errors, resyncs=decoder.resyncs,
+                            discardedBytes=decoder.discarded_bytes, acksOut=self._reader.acks_sent,
+                            bytesOut=self._reader.bytes_sent, retransmissionsDropped=self._reader.retransmissions)
+        return counters
+
+    def _engine_counters(self) -> collections.Counter:
+        counters = collections.Counter()
+        if self._engine is not None:
+            counters.update(commandsSent=self._engine.frames_sent, nacksIn=self._engine.nacks,
+                            commandsRejected=self._engine.rejected, commandTimeouts=self._engine.timeouts)
+        return counters
+
+    def counters(self) -> dict[str, int]:
+        """
+        :return: Totals of every counter, keyed by Indigo state id.
+        """
+        counters = self._previous + self._reader_counters() + self._engine_counters()
+        counters["framesOut"] = self.frames_out + counters["acksOut"]
+        counters["bytesOut"] += self.bytes_out
+        counters["acksIn"] = self.messages_in[const.MessageType.ACK]
+        counters["unknownMessages"] = self.unknown_messages
+        return {key: counters[key] for key in COUNTERS}
+
+    def states(self) -> list[tuple[str, object]]:
+        """
+        All link states for the panel interface device.
+        :return: (state id, value) pairs.
+        """
+        states = [("linkUp", self.link_up), ("reconnects", self.reconnects),
+                  ("linkDownSeconds", round(self.down_time)), ("baudRate", self.baud_rate),
+                  ("throughput", round(self.throughput))] + list(self.counters().items())
+        engine = self._engine
+        if engine is not None:
+            round_trips = Histogram()
+            for histogram in engine.round_trips.values():
+                round_trips.merge(histogram)
+            states += [("commandQueueDepth", engine.depth), ("commandQueueHighWater", engine.high_water),
+                       ("roundTripAvgMs", round(round_trips.average, 1)),
+                       ("roundTripP95Ms", round(round_trips.percentile(0.95), 1)),
+                       ("roundTripMaxMs", round(round_trips.maximum, 1))]
+        states += [("eventQueueHighWater", self.event_queue_high_water),
+                   ("dispatchMaxMs", round(self.dispatch.maximum, 1))]
+        return states
+
+    def changed_states(self) -> list[tuple[str, object]]:
+        """
+        Link states that changed since the last call, so periodic device updates only send what moved.
+        :return: (state id, value) pairs.
+        """
+        changes = [(key, value) for key, value in self.states() if self._published.get(key) != value]
+        self._published.update(changes)
+        return changes
+
+    def report(self) -> list[str]:
+        """
+        :return: Human readable lines describing the link, for the plugin menu dump.
+        """
+        uptime = time.monotonic() - self.started
+        counters = self.counters()
+        lines = [f"Link statistics over {uptime / 3600:.2f} hours:",
+                 f"  Link {'up' if self.link_up else 'down'} at {self.baud_rate} bps"
+                 f"{f', measured {self.throughput:.0f} bytes/s' if self.throughput else ''}; "
+                 f"{self.reconnects} reconnects, {self.down_time:.0f}s spent reconnecting",
+                 f"  Received {counters['framesIn']} frames ({counters['bytesIn']} bytes), "
+                 f"sent {counters['framesOut']} frames ({counters['bytesOut']} bytes) "
+                 f"including {counters['acksOut']} ACKs",
+                 f"  Framing errors: {counters['checksumErrors']} checksum, {counters['escapeErrors']} escape, "
+                 f"{counters['lengthErrors']} length; {counters['resyncs']} resyncs, "
+                 f"{counters['discardedBytes']} bytes discarded",
+                 f"  Retransmissions dropped: {counters['retransmissionsDropped']}, "
+                 f"unknown messages: {counters['unknownMessages']}",
+                 f"  Commands: {counters['commandsSent']} sent, {counters['acksIn']} ACKed, "
+                 f"{counters['nacksIn']} NACKed, {counters['commandsRejected']} rejected, "
+                 f"{counters['commandTimeouts']} timed out",
+                 f"  Message processing: {self.dispatch.summary()}, "
+                 f"event queue high water {self.event_queue_high_water}"]
+        if self.batcher is not None:
+            lines.append(f"  Device updates: {self.batcher.changes_queued} state changes queued, "
+                         f"{self.batcher.changes_written} written in {self.batcher.server_calls} server calls")
+        engine = self._engine
+        if engine is not None:
+            lines.append(f"  Command queue: depth {engine.depth}, high water {engine.high_water}; "
+                         f"{engine.unsupported} not enabled on the panel, {engine.fallbacks} sent as a fallback")
+            for command, histogram in sorted(engine.round_trips.items()):
+                lines.append(f"  Round trip {command.name}: {histogram.summary()}")
+        for message_type, count in self.messages_in.most_common():
+            lines.append(f"  Received {message_type.name}: {count}")
+        return lines
@@ -0,0 +1,967 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+# noinspection PyUnresolvedReferences
+import indigo
+
+import batcher
+import cache
+import capabilities
+import capture
+import codec
+import commands
+import constants as const
+import eventlog
+import messages
+import metrics
+import probe
+import protolog
+import reader
+import state
+import sync
+
+RECONNECT_DELAY_MIN = 1.0   # Seconds before the first attempt to reopen a failed link
+RECONNECT_DELAY_MAX = 60.0  # Longest wait between attempts
+PENDING_HOLD = 30.0         # Seconds queued commands wait for the link before they fail
+HEARTBEAT_INTERVAL = 30.0   # Seconds without receiving anything before the panel is asked for its status
+HEARTBEAT_MISSES = 2        # Unanswered status requests in a row that mean the link is dead
+STOP_TIMEOUT = 5.0          # Seconds to wait for the communication loop to stop
+ERROR_CHECK_MIN_FRAMES = 50  # Frames received in a statistics interval before its framing error rate is judged
+
+
+def data_path(plugin_id: str, filename: str) -> str:
+    """
+    :param plugin_id: Indigo plugin id.
+    :param filename: File name.
+    :return: Path of the file in the plugin's preferences folder.
+    """
+    return os.path.join(indigo.server.getInstallFolderPath(), "Preferences", "Plugins", plugin_id, filename)
+
+
+class PanelInterface:
+    """
+    One NX-584 interface and the Indigo devices behind it.
+
+    Each interface has its own serial connection, reader, communication loop thread, command engine, state model,
+    panel cache, event history, update batcher and link counters, so a slow or failing link only delays its own
+    devices and can be stopped and restarted on its own. The loop thread reopens a link that fails and then
+    reconciles the state with a snapshot pass.
+
+    start() and stop() are called from Indigo's device callbacks for the panel interface device; zone and partition
+    devices register with add_device() whether or not the interface is running.
+    """
+
+    def __init__(self, plugin, device_id: int):
+        """
+        :param plugin: The Indigo plugin, for its preferences, logger and serial port helpers.
+        :param device_id: Indigo device id of the panel interface device.
+        """
+        self._plugin = plugin
+        self.device_id = device_id
+        self.name = f"Panel interface {device_id}"
+        self.logger = plugin.logger.getChild(f"panel{device_id}")
+        self._log = protolog.ProtocolLogging(self.logger)
+        self._thread = None
+        self._stop_requested = threading.Event()
+        self._device_props = {}
+        self._conn = None
+        self._capture = None
+        self._reader = None
+        self._events = queue.Queue()
+        self._reconnect_delay = RECONNECT_DELAY_MIN
+        self._link_lost = False
+        self._last_received = 0.0
+        self._heartbeat_pending = False
+        self._missed_heartbeats = 0
+        self._probe_requested = False
+        self._avoid_rate = None             # Baud rate whose error rate climbed, probed last
+        self._error_check = (0, 0)          # Frames and framing errors at the last error rate check
+        self._write_lock = threading.Lock()
+        self._engine = None
+        self._batcher = batcher.UpdateBatcher(self._update_device_states)
+        self._metrics = metrics.LinkMetrics()
+        self._metrics.batcher = self._batcher
+        self._next_metrics_update = 0.0
+        self._state = state.PanelState()
+        self._sync = None
+        self._synced = False
+        self._warm_start_key = None
+        self._cache = cache.PanelCache(data_path(plugin.pluginId, f"panelCache-{device_id}.json"), self.logger)
+        self._event_history = eventlog.EventHistory(data_path(plugin.pluginId, f"eventHistory-{device_id}.bin"),
+                                                    self.logger)
+        self._event_log = None
+        self._zone_name_refreshes: list[int] = []     # Zones whose names are still to be read, last first
+        self._zone_name_reading = None                  # Zone whose name read is queued or in flight
+        self._zone_name_stalled = False                 # The next read found the command queue full
+        # Devices are added and removed on the Indigo thread and looked up on the loop thread
+        self._devices_lock = threading.Lock()
+        self._partition_devices: dict[int, int] = {}    # Partition number -> Indigo device id
+        self._zone_devices: dict[int, int] = {}         # Zone number -> Indigo device id
+        self._message_handlers = {
+            const.MessageType.IntConfigRsp: self._process_int_config_rsp,
+            const.MessageType.ZoneNameRsp: self._process_zone_name_rsp,
+            const.MessageType.ZoneStatusRsp: self._process_zone_status_rsp,
+            const.MessageType.ZonesSnapshotRsp: self._process_zones_snapshot_rsp,
+            const.MessageType.PartitionStatusRsp: self._process_partition_status_rsp,
+            const.MessageType.SystemStatusRsp: self._process_system_status_rsp,
+            const.MessageType.ProgramDataRsp: self._process_program_data_rsp,
+            const.MessageType.LogEventInd: self._process_log_event_ind,
+        }
+        self._read_timeout = 0.5
+        self._idle_timeout = 5.0
+        self._metrics_interval = 60.0
+        self.configure(plugin.pluginPrefs)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def configure(self, prefs) -> int:
+        """
+        Apply the protocol log levels and the device update window from the plugin preferences.
+
+        :param prefs: Plugin preferences.
+        :return: The lowest log level enabled by any protocol log category.
+        """
+        try:
+            self._batcher.window = int(prefs.get(const.PPK.UPDATE_WINDOW.value, 250)) / 1000.0
+        except ValueError:
+            self._batcher.window = batcher.DEFAULT_WINDOW
+        return self._log.configure(prefs)
+
+    def start(self, device, props) -> None:
+        """
+        Start supervising the link on its own thread. The serial port is opened on that thread, so a port that is
+        slow to open never holds up Indigo or the other interfaces.
+
+        :param device: The panel interface device.
+        :param props: Device properties holding the serial port and baud rate.
+        :return: None.
+        """
+        self.name = device.name
+        self._update_device_states(device.id, self._interface_states())
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            if not self._stop_requested.is_set():
+                return
+            # Two loops would share the connection and the command engine, so the one stopping must finish first
+            thread.join(STOP_TIMEOUT)
+            if thread.is_alive():
+                self.logger.error(f"{self.name}: The communication loop has not stopped; not starting another")
+                return
+        self._device_props = props
+        self._stop_requested.clear()
+        self._synced = False
+        self._thread = threading.Thread(target=self._run, name=f"Caddx {device.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """
+        Stop the communication loop and wait for it to close the serial port. A loop still running after the
+        timeout is kept track of, so start() waits for it rather than running a second one.
+
+        :param timeout: Longest time to wait for the loop thread.
+        :return: None.
+        """
+        self._stop_requested.set()
+        self._events.put((reader.EventType.STOP, None))
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            if thread.is_alive():
+                self.logger.warning(f"{self.name}: Communication loop still running after {timeout:.0f}s")
+                return
+        self._thread = None
+
+    def add_device(self, device) -> None:
+        """
+        Route a zone or partition device's updates through this interface and show the states already known.
+
+        :param device: Zone or partition device.
+        :return: None.
+        """
+        match device.deviceTypeId:
+            case const.DeviceTypeId.PARTITION.value:
+                partition = int(device.pluginProps[const.DPK.PARTITION_NUMBER.value])
+                with self._devices_lock:
+                    self._partition_devices[partition] = device.id
+                self._update_device_states(device.id, self._state.partition_states(partition))
+            case const.DeviceTypeId.ZONE.value:
+                zone = int(device.pluginProps[const.DPK.ZONE_NUMBER.value])
+                with self._devices_lock:
+                    self._zone_devices[zone] = device.id
+                changes = self._state.zone_states(zone)
+                zone_name = self._cache.zone_names().get(zone)
+                if zone_name is not None:
+                    changes.append(("zoneName", zone_name))
+                self._update_device_states(device.id, changes)
+
+    def remove_device(self, device_id: int) -> None:
+        """
+        Stop routing updates to a zone or partition device.
+
+        :param device_id: Indigo device id.
+        :return: None.
+        """
+        self._batcher.discard(device_id)
+        with self._devices_lock:
+            for devices in (self._partition_devices, self._zone_devices):
+                for number, registered_id in list(devices.items()):
+                    if registered_id == device_id:
+                        del devices[number]
+
+    @property
+    def device_count(self) -> int:
+        with self._devices_lock:
+            return len(self._partition_devices) + len(self._zone_devices)
+
+    def _zone_device(self, zone: int) -> int | None:
+        """
+        :param zone: Zone number.
+        :return: The Indigo device id of the zone, or None if it has no device.
+        """
+        with self._devices_lock:
+            return self._zone_devices.get(zone)
+
+    def _partition_device(self, partition: int) -> int | None:
+        """
+        :param partition: Partition number.
+        :return: The Indigo device id of the partition, or None if it has no device.
+        """
+        with self._devices_lock:
+            return self._partition_devices.get(partition)
+
+    def report(self) -> list[str]:
+        """
+        :return: Link statistics lines for the plugin menu dump.
+        """
+        return [f"{self.name}:"] + self._metrics.report()
+
+    def event_report(self, start: float) -> list[str]:
+        """
+        :param start: Earliest event time to include.
+        :return: Event history lines for the plugin menu dump.
+        """
+        records = list(self._event_history.query(start=start))
+        return [f"{self.name}: {len(records)} panel event(s) since {time.strftime('%Y-%m-%d %H:%M', time.localtime(start))} "
+                f"({self._event_history.count} in '{self._event_history.path}'):"] + \
+               [f"  {record.describe()}" for record in records]
+
+    def _run(self) -> None:
+        """
+        Supervise the link until stop() is called: open the serial port, run the communication loop while the
+        link is up, and reopen the port after a failure, waiting twice as long after each failed attempt, up to
+        RECONNECT_DELAY_MAX. The command engine, panel state and device updates carry on across reconnects.
+
+        :return: None.
+        """
+        serial_url = self._plugin.getSerialPortUrl(self._device_props, const.DPK.PORT.value)
+        if not serial_url:
+            self.logger.error(f"{self.name}: No serial port configured.")
+            return
+
+        self._engine = commands.CommandEngine(self._send_message, wake=self._wake_loop, logger=self._log.queue)
+        self._event_log = eventlog.EventLogSync(self._engine, self._event_history, self._log.queue,
+                                                on_record=self._log_event_recorded)
+        self._reconnect_delay = RECONNECT_DELAY_MIN
+        down_since = None
+        self.logger.info(f"{self.name}: Communication loop started")
+        try:
+            while not self._stop_requested.is_set():
+                if self._connect(serial_url):
+                    if down_since is not None:
+                        self.logger.info(f"{self.name}: Serial link restored after "
+                                         f"{time.monotonic() - down_since:.0f}s")
+                    self._communicate()
+                    self._disconnect()
+                    if self._stop_requested.is_set():
+                        break
+                    if self._probe_requested:
+                        continue
+                    down_since = time.monotonic()
+                elif self._stop_requested.is_set():
+                    break
+                elif down_since is None:
+                    down_since = time.monotonic()
+
+                # Queued commands wait for the link for a while, then fail rather than go out long after the fact
+                if self._engine.busy and time.monotonic() - down_since >= PENDING_HOLD:
+                    self._log.queue.warning(f"Failing {self._engine.depth} queued command(s); "
+                                            f"the serial link is still down")
+                    self._engine.cancel_all(f"Serial link down for more than {PENDING_HOLD:.0f}s")
+                self.logger.warning(f"{self.name}: Reconnecting in {self._reconnect_delay:.0f}s")
+                self._stop_requested.wait(self._reconnect_delay)
+                self._reconnect_delay = min(2 * self._reconnect_delay, RECONNECT_DELAY_MAX)
+        except Exception as err:
+            self.logger.exception(f"{self.name}: Communication loop failed: {err}")
+        finally:
+            self.logger.info(f"{self.name}: Communication loop stopped")
+            if self._conn is not None:
+                self._disconnect()
+            if self._capture is not None:
+                self._capture.close()
+                self._capture = None
+            self._event_log = None
+            self._engine.cancel_all("Communication loop stopped")
+            self._publish_link_states()
+            self._batcher.flush(force=True)
+            self._engine = None
+
+    def _connect(self, serial_url: str) -> bool:
+        """
+        Open the serial port, start the reader and send the Interface Configuration request that starts the sync.
+
+        :param serial_url: Serial port URL.
+        :return: True if the port is open.
+        """
+        auto = self._device_props[const.DPK.BAUD.value] == probe.AUTO
+        if auto:
+            baud_rate = self._device_props.get(const.DPK.DETECTED_BAUD.value) or 9600
+        else:
+            baud_rate = self._device_props[const.DPK.BAUD.value]
+        self._conn = self._plugin.openSerial(self.name, serial_url, baud_rate, timeout=self._read_timeout,
+                                             writeTimeout=1.0)
+        if not self._conn:
+            self._conn = None
+            self.logger.error(f"{self.name}: Unable to open serial port at {serial_url}.")
+            return False
+        self.logger.debug(f"{self.name}: Serial connection opened on '{serial_url}'")
+        # One capture writer serves every connection until the loop stops, so reconnects do not rotate the file
+        if self._plugin.pluginPrefs.get(const.PPK.CAPTURE.value, False):
+            if self._capture is None:
+                self._capture = capture.CaptureWriter(
+                    os.path.join(indigo.server.getLogsFolderPath(pluginId=self._plugin.pluginId),
+                                 f"serialCapture-{self.device_id}.bin"), logger=self.logger)
+                self.logger.info(f"{self.name}: Capturing serial traffic to '{self._capture.path}'")
+            self._conn = capture.CaptureConnection(self._conn, self._capture)
+        elif self._capture is not None:
+            self._capture.close()
+            self._capture = None
+        self._metrics.baud_rate = int(baud_rate)
+        if (auto or self._probe_requested) and not self._probe_link(auto):
+            self._conn.close()
+            self._conn = None
+            return False
+        self._conn.reset_input_buffer()
+        # Events of the previous connection, including its reader's failure, no longer apply
+        while not self._events.empty():
+            self._events.get_nowait()
+        self._reader = reader.SerialReader(self._conn, self._events, self._log.wire, write_lock=self._write_lock,
+                                           history=self._log.history, name=f"Caddx reader {self.device_id}")
+        self._metrics.attach(self._reader, self._engine)
+        self._metrics.record_link(True)
+        self._reader.start()
+        self._last_received = time.monotonic()
+        self._missed_heartbeats = 0
+        self._link_lost = False
+
+        # Send Interface Configuration Request to get panel operational parameters.  Results processed in _process_message()
+        self._send_interface_configuration_request()
+        if not self._synced:
+            self._warm_start()
+        self._publish_link_states()
+        return True
+
+    def _communicate(self) -> None:
+        """
+        Run the communication loop until the link fails or stop() is called.
+
+        :return: None.
+        """
+        try:
+            while not self._stop_requested.is_set():
+                # Write device updates whose window has ended, send queued commands and expire unanswered ones, then
+                # block until the reader delivers a message, a command is queued, the command in flight times out,
+                # more device updates are due or the link has been quiet long enough for a heartbeat.
+                self._batcher.flush()
+                if self._zone_name_stalled:
+                    self._read_next_zone_name()
+                now = time.monotonic()
+                heartbeat_timeout = self._check_heartbeat(now)
+                response_timeout = self._engine.poll(now)
+                if self._link_lost:
+                    return
+                timeout = min(t for t in (response_timeout, self._batcher.timeout(), heartbeat_timeout,
+                                          self._idle_timeout) if t is not None)
+                if now >= self._next_metrics_update:
+                    self._publish_link_states()
+                    self._log.flush()
+                    if self._framing_errors_climbing():
+                        return
+                if self._probe_requested:
+                    return
+                try:
+                    event_type, payload = self._events.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+
+                match event_type:
+                    case reader.EventType.FRAME:
+                        self._last_received = time.monotonic()
+                        self._missed_heartbeats = 0
+                        if self._log.wire.isEnabledFor(logging.DEBUG):
+                            self._log.wire.debug(f"Received message: {payload.hex()}")
+                        self._process_received_message(payload)
+                    case reader.EventType.READER_FAILED:
+                        self.logger.error(f"{self.name}: Serial connection lost.")
+                        return
+                    case reader.EventType.STOP:
+                        return
+        except OSError as err:
+            self.logger.error(f"{self.name}: Serial write failed: {err}")
+
+    def request_probe(self) -> None:
+        """
+        Probe the link again: the connection is reopened and its throughput measured. An interface set to detect
+        its baud rate tries every rate again.
+
+        :return: None.
+        """
+        self._probe_requested = True
+        self._wake_loop()
+
+    def _probe_link(self, auto: bool) -> bool:
+        """
+        Find the fastest baud rate the panel answers reliably on, or with auto False just measure the configured
+        one, and leave the connection at that rate.
+
+        :param auto: True to try every rate.
+        :return: True if the panel answered.
+        """
+        self._probe_requested = False
+        current = int(self._conn.baudrate)
+        if auto:
+            # The last detected rate is the one to beat, unless its framing error rate climbed
+            rates = sorted(probe.BAUD_RATES, reverse=True)
+            rates.sort(key=lambda rate: 1 if rate == self._avoid_rate else 0 if rate == current else 0.5)
+        else:
+            rates = [current]
+        self._avoid_rate = None
+        link_probe = probe.LinkProbe(self._conn, self._log.wire, stop=self._stop_requested)
+        result = link_probe.run(rates)
+        if self._stop_requested.is_set():
+            return False
+        if result is None:
+            self.logger.error(f"{self.name}: No response from the panel at "
+                              f"{', '.join(str(rate) for rate in rates)} bps.")
+            return False
+        self.logger.info(f"{self.name}: Serial link at {result.describe()}")
+        if not result.reliable:
+            self.logger.warning(f"{self.name}: No baud rate was reliable; using the one with the fewest errors.")
+        self._metrics.baud_rate = result.baudrate
+        self._metrics.throughput = result.throughput
+        device = indigo.devices.get(self.device_id)
+        if auto and device is not None and device.pluginProps.get(const.DPK.DETECTED_BAUD.value) != result.baudrate:
+            props = device.pluginProps
+            props[const.DPK.DETECTED_BAUD.value] = result.baudrate
+            device.replacePluginPropsOnServer(props)
+            self._device_props[const.DPK.DETECTED_BAUD.value] = result.baudrate
+        return True
+
+    def _framing_errors_climbing(self) -> bool:
+        """
+        Check the framing error rate over the last statistics interval. When it climbs past probe.MAX_ERROR_RATE
+        on an interface that detects its baud rate, a probe is requested so the next reliable rate is chosen.
+
+        :return: True if the link should be probed again.
+        """
+        counters = self._metrics.counters()
+        errors = counters["checksumErrors"] + counters["escapeErrors"] + counters["lengthErrors"]
+        frames = counters["framesIn"]
+        previous_frames, previous_errors = self._error_check
+        self._error_check = (frames, errors)
+        frames, errors = frames - previous_frames, errors - previous_errors
+        if self._device_props.get(const.DPK.BAUD.value) != probe.AUTO or frames + errors < ERROR_CHECK_MIN_FRAMES:
+            return False
+        if errors / (frames + errors) <= probe.MAX_ERROR_RATE:
+            return False
+        self.logger.warning(f"{self.name}: {errors} framing errors in {frames + errors} frames at "
+                            f"{self._metrics.baud_rate} bps; probing the link again")
+        self._avoid_rate = self._metrics.baud_rate
+        self._probe_requested = True
+        return True
+
+    def _disconnect(self) -> None:
+        """
+        Close the serial port after a failure or stop(). The request in flight goes back on the queue, and the
+        syncs in progress are abandoned; the reconciliation after the reconnect catches up with the panel.
+
+        :return: None.
+        """
+        # Reopening the port to probe it is not an outage
+        if not self._probe_requested:
+            self._metrics.record_link(False)
+        self._reader.stop(timeout=2 * self._read_timeout)
+        self._reader = None
+        self._conn.close()
+        self._conn = None
+        if self._sync:
+            self._sync.cancel()
+            self._sync = None
+        self._event_log.cancel()
+        self._engine.suspend()
+        self._cache.save()
+        self._publish_link_states()
+        self._batcher.flush(force=True)
+        self.logger.debug(f"{self.name}: Serial connection closed")
+
+    def _check_heartbeat(self, now: float) -> float | None:
+        """
+        Ask for System Status when nothing has been received for HEARTBEAT_INTERVAL, to find out whether the
+        panel is still there. The request jumps the queue, so a backlog cannot hide a dead link.
+
+        :param now: Current monotonic time.
+        :return: Seconds until the next heartbeat is due, or None while one is waiting for its response.
+        """
+        if self._heartbeat_pending:
+            return None
+        due = self._last_received + HEARTBEAT_INTERVAL - now
+        if due > 0:
+            return due
+        self._heartbeat_pending = True
+        self._queue_command(const.MessageType.SystemStatusReq, callback=self._heartbeat_done,
+                            priority=const.CommandPriority.Interactive)
+        return None
+
+    def _heartbeat_done(self, future: Future) -> None:
+        """
+        Completion callback for heartbeat requests. HEARTBEAT_MISSES unanswered in a row, with nothing else
+        received meanwhile, mean the link is dead.
+
+        :param future: Completed request future.
+        :return: None.
+        """
+        self._heartbeat_pending = False
+        if not isinstance(future.exception(), commands.CommandTimeout):
+            return
+        self._missed_heartbeats += 1
+        if self._missed_heartbeats >= HEARTBEAT_MISSES:
+            self.logger.error(f"{self.name}: No response from the panel to {self._missed_heartbeats} "
+                              f"status requests; reconnecting.")
+            self._link_lost = True
+
+    def _wake_loop(self) -> None:
+        """
+        Wake the communication loop so it sends newly queued commands.
+        :return: None
+        """
+        self._events.put((reader.EventType.COMMAND, None))
+
+    def _queue_command(self, message_type: const.MessageType, message_data: bytearray = None,
+                       callback: Callable[[Future], None] = None, priority: const.CommandPriority = None,
+                       first: bool = False) -> Future:
+        """
+        Queue a request for sending to the panel and wake the communication loop.
+
+        :param message_type: The message type to send.
+        :param message_data: Ancillary message data, if used.
+        :param callback: Optional callable invoked with the future when the request completes.
+        :param priority: Overrides the default priority for the message type in const.CommandTable.
+        :param first: Queue the request ahead of everything already queued at its priority.
+        :return: Future resolved with the response message, or failed with a commands.CommandError.
+        """
+        return self._engine.submit(message_type, message_data, callback=callback, priority=priority, first=first)
+
+    def _process_received_message(self, message: bytearray) -> None:
+        """
+        Process received messages.
+
+        :param message: The received message, starting from command byte.
+        :return: None.
+        """
+        started = time.monotonic()
+        try:
+            message_type = const.MessageType(message[0] & ~0xc0)
+        except ValueError:
+            message_type = None
+        decoded = messages.decode(message_type, message) if message_type is not None else None
+        if decoded is None:
+            self._log.decode.error("Invalid message type or length for type. Discarding message.")
+            self._metrics.record_dispatch(None, time.monotonic() - started, self._events.qsize())
+            return
+        handler = self._message_handlers.get(message_type)
+        if handler:
+            handler(decoded)
+        elif message_type not in const.NegativeResponses and message_type != const.MessageType.ACK:
+            self._log.decode.debug(f"No handler for message type {message_type.name}")
+
+        # Complete the matching request only after the message has been merged, so completion callbacks see it
+        if not self._engine.handle_message(message_type, decoded) and message_type in const.NegativeResponses:
+            self._log.queue.debug(f"Unexpected {message_type.name} with no request pending")
+        self._metrics.record_dispatch(message_type, time.monotonic() - started, self._events.qsize())
+
+    def _interface_states(self) -> state.StateChanges:
+        """
+        All states of the panel interface device, for initializing it when it starts.
+
+        :return: (state id, value) pairs.
+        """
+        changes = self._state.system_states() + self._metrics.states()
+        if self._event_history.last is not None:
+            changes.append(("lastLogEvent", self._event_history.last.describe()))
+        return changes
+
+    def _publish_link_states(self) -> None:
+        """
+        Push link statistics that changed since the last update to the panel interface device.
+
+        :return: None.
+        """
+        self._next_metrics_update = time.monotonic() + self._metrics_interval
+        self._batcher.add(self.device_id, self._metrics.changed_states())
+
+    def _update_device_states(self, device_id: int | None, changes: state.StateChanges) -> None:
+        """
+        Push changed states to an Indigo device in one server call. Message handlers queue their changes on the
+        update batcher, which calls this once per device when its window ends.
+
+        :param device_id: Indigo device id, or None if no device is configured for the zone/partition.
+        :param changes: (state id, value) pairs that changed.
+        :return: None.
+        """
+        if device_id is None or not changes:
+            return
+        device = indigo.devices.get(device_id)
+        if device is None:
+            return
+        if self._log.state.isEnabledFor(logging.DEBUG):
+            self._log.state.debug(f"{device.name}: {', '.join(f'{key}={value}' for key, value in changes)}")
+        device.updateStatesOnServer([{"key": key, "value": value} for key, value in changes])
+
+    def _process_int_config_rsp(self, message: messages.IntConfigRsp) -> None:
+        """
+        Process IntConfigRsp message.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        panel_firmware = message.firmware.decode('ascii')
+        self._log.decode.debug(f"Panel firmware: {panel_firmware}")
+        self._record_interface_configuration(panel_firmware, message)
+
+        # Log enabled transition-based broadcast and command/request messages
+        if self._log.decode.isEnabledFor(logging.DEBUG):
+            transitions = [flag.name for flags, value in ((const.TransitionMessageFlags1,
+                                                           message.transition_message_flags1),
+                                                          (const.TransitionMessageFlags2,
+                                                           message.transition_message_flags2))
+                           for flag in flags if value & flag]
+            requests = [flag.name for flags, value in ((const.RequestCommandFlags1, message.request_command_flags1),
+                                                       (const.RequestCommandFlags2, message.request_command_flags2),
+                                                       (const.RequestCommandFlags3, message.request_command_flags3),
+                                                       (const.RequestCommandFlags4, message.request_command_flags4))
+                        for flag in flags if value & flag]
+            self._log.decode.debug(f"Transition-based broadcast messages enabled: {', '.join(transitions)}")
+            self._log.decode.debug(f"Command/request messages enabled: {', '.join(requests)}")
+
+        # Compile the flags into the set of messages the panel supports, used to gate every request from now on
+        panel_capabilities = capabilities.PanelCapabilities.from_flags(bytes(message[1:3]), bytes(message[3:7]))
+        missing = panel_capabilities.missing_required()
+        if missing:
+            self.logger.error(f"{self.name}: Required messages not enabled in the panel configuration: "
+                              f"{', '.join(missing)}")
+            self.logger.error("Please enable the required messages in the Caddx panel configuration before starting plugin.")
+            raise Exception("Required  messages not enabled in panel config")
+        if not panel_capabilities.supports(const.MessageType.ZoneNameReq):
+            self.logger.warning(f"{self.name}: Zone Name requests are not enabled on the panel; "
+                                f"zone names will not be read")
+        self._engine.capabilities = panel_capabilities
+
+        # The panel answers, so the link works; the next failure starts over with a short reconnect delay
+        self._reconnect_delay = RECONNECT_DELAY_MIN
+
+        # Zone names and program data cached for this exact panel configuration are usable right away
+        previous_key = self._cache.key
+        cache_key = self._cache.make_key(panel_firmware, bytes(message[1:]))
+        if cache_key != self._cache.key:
+            if self._cache.load(cache_key):
+                self.logger.debug(f"Loaded {len(self._cache.zone_names())} cached zone names")
+                for zone, zone_name in self._cache.zone_names().items():
+                    self._batcher.add(self._zone_device(zone), [("zoneName", zone_name)])
+        if self._cache.set("capabilities", panel_capabilities.to_json()):
+            self._cache.save()
+
+        # After a reconnect to an unchanged panel, one snapshot pass brings the state up to date
+        if self._synced and cache_key == previous_key:
+            if self._sync is None or not self._sync.running:
+                self._start_sync(reconcile=True)
+            return
+
+        # Build the initial zone/partition picture, unless a sync is already under way, or was started from the
+        # cached configuration this response confirms
+        confirmed = self._warm_start_key == cache_key
+        if self._warm_start_key is not None and not confirmed and self._sync:
+            self._log.queue.info("Panel configuration differs from the cached one; restarting the startup sync")
+            self._sync.cancel()
+        self._warm_start_key = None
+        if not confirmed and (self._sync is None or not self._sync.running):
+            self._start_sync()
+
+    def _record_interface_configuration(self, panel_firmware: str, message: messages.IntConfigRsp) -> None:
+        """
+        Keep the panel firmware and configuration flags in the panel interface device's properties, writing them
+        only when they change.
+
+        :param panel_firmware: Panel firmware version.
+        :param message: The decoded Interface Configuration response.
+        :return: None.
+        """
+        device = indigo.devices.get(self.device_id)
+        if device is None:
+            return
+        props = device.pluginProps
+        values = {const.DPK.PANEL_FIRMWARE.value: panel_firmware,
+                  const.DPK.TRANSITION_MESSAGE_FLAGS1.value: message.transition_message_flags1,
+                  const.DPK.TRANSITION_MESSAGE_FLAGS2.value: message.transition_message_flags2,
+                  const.DPK.REQUEST_COMMAND_FLAGS1.value: message.request_command_flags1,
+                  const.DPK.REQUEST_COMMAND_FLAGS2.value: message.request_command_flags2,
+                  const.DPK.REQUEST_COMMAND_FLAGS3.value: message.request_command_flags3,
+                  const.DPK.REQUEST_COMMAND_FLAGS4.value: message.request_command_flags4}
+        if all(props.get(key) == value for key, value in values.items()):
+            return
+        props.update(values)
+        device.replacePluginPropsOnServer(props)
+
+    def _warm_start(self) -> None:
+        """
+        Start the startup sync with the capabilities cached with the last interface configuration, without waiting
+        for the Interface Configuration response. The response confirms them, or replaces them and restarts the
+        sync.
+
+        :return: None.
+        """
+        if self._cache.key is None:
+            self._cache.load()
+        panel_capabilities = capabilities.PanelCapabilities.from_json(self._cache.get("capabilities"))
+        if panel_capabilities is None:
+            return
+        self._log.queue.debug(f"Starting with the cached panel configuration {self._cache.key}")
+        self._engine.capabilities = panel_capabilities
+        self._warm_start_key = self._cache.key
+        self._start_sync()
+
+    def _start_sync(self, reconcile: bool = False) -> None:
+        """
+        Start reading the initial zone, partition and system status.
+
+        :param reconcile: True to bring the state up to date after a reconnect rather than build it.
+        :return: None.
+        """
+        self._sync = sync.StartupSync(self._engine, self._state, self._log.queue,
+                                      on_complete=self._startup_sync_complete, reconcile=reconcile)
+        self._sync.start()
+
+    def _process_zone_name_rsp(self, message: messages.ZoneNameRsp) -> None:
+        """
+        Process ZoneNameRsp message. Cached names that differ from the panel are replaced.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        zone = message.zone + 1
+        zone_name = message.name.decode('ascii', errors='replace').strip()
+        if self._cache.set_zone_name(zone, zone_name):
+            self._log.decode.debug(f"Zone {zone} name: {zone_name}")
+            self._batcher.add(self._zone_device(zone), [("zoneName", zone_name)])
+            if not self._zone_name_refreshes:
+                self._cache.save()
+
+    def _process_program_data_rsp(self, message: messages.ProgramDataRsp) -> None:
+        """
+        Process ProgramDataRsp message into the panel cache.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        if self._cache.set_program_data(message.bus_address, message.location, message.data):
+            self._cache.save()
+
+    def _process_zone_status_rsp(self, message: messages.ZoneStatusRsp) -> None:
+        """
+        Process ZoneStatusRsp message.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        zone, changes = self._state.merge_zone_status(message)
+        self._batcher.add(self._zone_device(zone), changes)
+
+    def _process_zones_snapshot_rsp(self, message: messages.ZonesSnapshotRsp) -> None:
+        """
+        Process ZonesSnapshotRsp message.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        for zone, changes in self._state.merge_zones_snapshot(message):
+            self._batcher.add(self._zone_device(zone), changes)
+
+    def _process_partition_status_rsp(self, message: messages.PartitionStatusRsp) -> None:
+        """
+        Process PartitionStatusRsp message.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        partition, changes = self._state.merge_partition_status(message)
+        self._batcher.add(self._partition_device(partition), changes)
+
+    def _process_system_status_rsp(self, message: messages.SystemStatusRsp) -> None:
+        """
+        Process SystemStatusRsp message.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        self._batcher.add(self.device_id, self._state.merge_system_status(message))
+
+    def _process_log_event_ind(self, message: messages.LogEventInd) -> None:
+        """
+        Process LogEventInd message, either a transition or the response to an event log read.
+
+        :param message: The decoded message.
+        :return: None.
+        """
+        self._event_log.indication(message)
+
+    def _log_event_recorded(self, record: eventlog.EventRecord, live: bool) -> None:
+        """
+        Report an event added to the event history.
+
+        :param record: The event.
+        :param live: True if it arrived as a transition rather than from an event log read.
+        :return: None.
+        """
+        description = record.describe()
+        if live:
+            self.logger.info(f"{self.name}: Panel event: {description}")
+        else:
+            self._log.decode.debug(f"Panel event read from log: {description}")
+        self._batcher.add(self.device_id, [("lastLogEvent", description)])
+
+    def _startup_sync_complete(self, completed: sync.StartupSync) -> None:
+        """
+        Start the background reads that follow the startup sync: zone names, then new panel log events. After a
+        reconciliation a zone name refresh cut short by the outage resumes, and the log events read catch up with
+        the events logged while the link was down.
+
+        :param completed: The finished sync.
+        :return: None.
+        """
+        if not completed.reconcile:
+            self._refresh_zone_names()
+        else:
+            self._read_next_zone_name()
+        self._synced = True
+        if self._event_log:
+            self._event_log.start()
+
+    def _refresh_zone_names(self) -> None:
+        """
+        Re-read the names of zones with Indigo devices at background priority, one request at a time so the
+        refresh never fills the command queue. Cached names are shown meanwhile, and the cache is saved once when
+        the refresh finishes.
+
+        :return: None.
+        """
+        self._zone_name_refreshes = []
+        if not self._engine.supports(const.MessageType.ZoneNameReq):
+            return
+        with self._devices_lock:
+            self._zone_name_refreshes = sorted(self._zone_devices, reverse=True)
+        self._read_next_zone_name()
+
+    def _read_next_zone_name(self) -> None:
+        """
+        Queue the next read of the zone name refresh, unless one is already queued. If the command queue is full,
+        the communication loop tries again as it drains.
+
+        :return: None.
+        """
+        self._zone_name_stalled = False
+        if self._zone_name_reading is not None or not self._zone_name_refreshes or self._engine is None:
+            return
+        self._zone_name_reading = self._zone_name_refreshes.pop()
+        try:
+            self._queue_command(const.MessageType.ZoneNameReq, bytearray([self._zone_name_reading - 1]),
+                                callback=self._zone_name_refreshed)
+        except commands.CommandQueueFull:
+            self._zone_name_refreshes.append(self._zone_name_reading)
+            self._zone_name_reading = None
+            self._zone_name_stalled = True
+
+    def _zone_name_refreshed(self, future: Future) -> None:
+        """
+        Completion callback for background zone name reads; queues the next read, or saves the cache once the
+        refresh is finished. A read abandoned because the link went down is put back, to be read after the
+        reconciliation.
+
+        :param future: Completed request future.
+        :return: None.
+        """
+        zone, self._zone_name_reading = self._zone_name_reading, None
+        if future.exception() is not None and self._conn is None:
+            if zone is not None:
+                self._zone_name_refreshes.append(zone)
+            return
+        if self._zone_name_refreshes:
+            self._read_next_zone_name()
+        else:
+            self._cache.save()
+
+    def _send_message(self, message_type: const.MessageType, message_data: bytearray = None) -> None:
+        """
+        Send a message to the panel.
+
+        :param message_type: The message type to send.
+        :param message_data: Ancillary message data, if used.
+
+        :return: None
+        """
+        message_length = 1 + len(message_data) if message_data else 1
+        if message_type not in const.MessageValidLength:
+            self.logger.error(f"Unsupported message type: {message_type:02x}")
+            return
+        if not message_length == const.MessageValidLength[message_type]:
+            self.logger.error(f"Invalid message length for message type {message_type.name}. Expected {const.MessageValidLength[message_type]}, got {message_length}")
+            return
+
+        message_stuffed = codec.encode_frame(message_type, message_data)
+        if self._log.wire.isEnabledFor(logging.DEBUG):
+            self._log.wire.debug(f"Sending message: {message_stuffed.hex()}")
+        with self._write_lock:
+            if self._reader is not None:
+                self._reader.request_sent()
+            self._conn.write(message_stuffed)
+        self._log.history.record("TX", bytes([message_type]) + (message_data or b""))
+        self._metrics.record_sent(len(message_stuffed))
+
+    def _send_interface_configuration_request(self) -> None:
+        """
+        Queue an Interface Configuration Request message ahead of every queued command, including the one
+        interrupted by a reconnect, so the panel's capabilities are checked again before those are sent.
+
+        :return: None.
+        """
+        self._log.queue.debug("Sending Interface Configuration Request message")
+        self._queue_command(const.MessageType.IntConfigReq, callback=self._log_command_failure,
+                            priority=const.CommandPriority.Interactive, first=True)
+
+    def _log_command_failure(self, future: Future) -> None:
+        """
+        Completion callback that logs requests the panel did not answer successfully.
+
+        :param future: Completed request future.
+        :return: None.
+        """
+        error = future.exception()
+        if error:
+            self.logger.error(f"{self.name}: {error}")
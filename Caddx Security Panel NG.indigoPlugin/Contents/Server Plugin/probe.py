@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+import capabilities
+import codec
+import constants as const
+import messages
+import reader
+
+AUTO = "auto"               # Baud rate setting that detects the fastest rate the panel answers on
+BAUD_RATES = (76800, 38400, 19200, 9600, 4800, 2400)   # Rates the NX-584 and NX-8e can be programmed for
+BITS_PER_BYTE = 10          # Start bit, 8 data bits, stop bit
+PROBE_TIMEOUT = 0.5         # Seconds to wait for each response while probing
+BURST_REQUESTS = 16         # Requests in the stress burst that follows a successful Interface Configuration request
+MAX_ERROR_RATE = 0.05       # Failed requests and framing errors per request above which a rate is unreliable
+
+# Burst request -> message data for the nth request. The first one the panel enables is used; larger responses
+# measure throughput better. If the panel enables none of them, the burst is skipped.
+BURST_REQUEST_DATA = (
+    (const.MessageType.ZoneNameReq, lambda n: bytearray([n % 16])),
+    (const.MessageType.ZonesSnapshotReq, lambda n: bytearray([n % 12])),
+    (const.MessageType.SystemStatusReq, lambda n: None),
+)
+
+
+class ProbeResult(NamedTuple):
+    baudrate: int
+    answered: bool          # The panel answered the Interface Configuration request
+    round_trip: float       # Seconds for that request and its response
+    requests: int           # Burst requests sent
+    failures: int           # Burst requests without a valid response
+    frame_errors: int       # Checksum, escape and length errors while probing
+    bytes_transferred: int  # Bytes written and read during the burst
+    elapsed: float          # Duration of the burst
+
+    @property
+    def throughput(self) -> float:
+        """
+        :return: Bytes per second written and read during the burst.
+        """
+        return self.bytes_transferred / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """
+        :return: Throughput as a fraction of what the line carries at the baud rate.
+        """
+        return self.throughput * BITS_PER_BYTE / self.baudrate
+
+    @property
+    def error_rate(self) -> float:
+        if not self.requests:
+            # Without a burst the Interface Configuration exchange alone decides
+            return 1.0 if self.frame_errors or not self.answered else 0.0
+        return (self.failures + self.frame_errors) / self.requests
+
+    @property
+    def reliable(self) -> bool:
+        return self.answered and self.error_rate <= MAX_ERROR_RATE
+
+    def describe(self) -> str:
+        if not self.answered:
+            return f"{self.baudrate} bps: no response"
+        if not self.requests:
+            return (f"{self.baudrate} bps: {self.round_trip * 1000:.0f} ms round trip, {self.frame_errors} framing "
+                    f"errors, throughput not measured")
+        return (f"{self.baudrate} bps: {self.round_trip * 1000:.0f} ms round trip, {self.requests} requests, "
+                f"{self.failures} failed, {self.frame_errors} framing errors, {self.throughput:.0f} bytes/s "
+                f"({self.utilization:.0%} of the line rate)")
+
+
+class LinkProbe:
+    """
+    Finds the baud rate a panel answers on and measures the link at that rate.
+
+    The NX-584 rate is set in the panel programming and cannot be changed over the link, so the host tries each
+    candidate rate in turn, fastest first: an Interface Configuration request must be answered (it is retried like
+    any other command), then a burst of BURST_REQUESTS status requests must come back with an error rate of at
+    most MAX_ERROR_RATE. The first rate that passes is the fastest reliable one. The burst also gives the
+    effective throughput of the link.
+
+    The probe talks to the port directly and must run before the serial reader is started. Frames the panel
+    sends meanwhile are acknowledged if they ask for it and otherwise ignored. Setting the stop event ends the
+    probe after the request in progress.
+    """
+
+    def __init__(self, conn, logger: logging.Logger = None, stop: threading.Event = None):
+        """
+        :param conn: Open serial connection; its baudrate is changed while probing.
+        :param logger: Logger for the results.
+        :param stop: Event that abandons the probe when set.
+        """
+        self._conn = conn
+        self._logger = logger or logging.getLogger(__name__)
+        self._stop = stop or threading.Event()
+        # Framing errors are expected at the wrong rates and are counted in the results rather than logged
+        self._decoder_logger = self._logger.getChild("probe")
+        self._decoder_logger.setLevel(logging.CRITICAL)
+        self._decoder = None
+        self._bytes = 0
+        self.results: list[ProbeResult] = []
+
+    def run(self, rates: tuple[int, ...] | list[int]) -> ProbeResult | None:
+        """
+        Probe rates in the given order until one is reliable, leaving the connection at that rate. If none is,
+        the connection is left at the answering rate with the fewest errors.
+
+        :param rates: Candidate baud rates, fastest first.
+        :return: Result for the rate chosen, or None if the panel answered at none of them or the probe was
+            stopped.
+        """
+        for rate in rates:
+            if self._stop.is_set():
+                return None
+            result = self.probe(rate)
+            self.results.append(result)
+            self._logger.debug(f"Link probe: {result.describe()}")
+            if result.reliable:
+                return result
+        answered = [result for result in self.results if result.answered]
+        if not answered or self._stop.is_set():
+            return None
+        best = min(answered, key=lambda result: (result.error_rate, -result.baudrate))
+        self._conn.baudrate = best.baudrate
+        return best
+
+    def probe(self, baudrate: int) -> ProbeResult:
+        """
+        Try one baud rate.
+
+        :param baudrate: Rate to set on the connection.
+        :return: What the probe found.
+        """
+        self._conn.baudrate = baudrate
+        self._conn.reset_input_buffer()
+        self._decoder = codec.FrameDecoder(self._decoder_logger)
+        response = None
+        round_trip = 0.0
+        for _ in range(1 + const.COMMAND_RETRIES):
+            if self._stop.is_set():
+                break
+            started = time.monotonic()
+            response = self._request(const.MessageType.IntConfigReq)
+            round_trip = time.monotonic() - started
+            if response is not None:
+                break
+        config = messages.decode(const.MessageType.IntConfigRsp, response) if response is not None else None
+        if config is None:
+            return ProbeResult(baudrate, False, round_trip, 0, 0, self._frame_errors(), 0, 0.0)
+
+        panel_capabilities = capabilities.PanelCapabilities.from_flags(bytes(config[1:3]), bytes(config[3:7]))
+        message_type, message_data = next(((message_type, message_data)
+                                           for message_type, message_data in BURST_REQUEST_DATA
+                                           if panel_capabilities.supports(message_type)), (None, None))
+        if message_type is None:
+            self._logger.debug(f"Link probe: no burst request is enabled on the panel; "
+                               f"throughput not measured at {baudrate} bps")
+            return ProbeResult(baudrate, True, round_trip, 0, 0, self._frame_errors(), 0, 0.0)
+        self._bytes = 0
+        requests = failures = 0
+        started = time.monotonic()
+        while requests < BURST_REQUESTS and not self._stop.is_set():
+            if self._request(message_type, message_data(requests)) is None:
+                failures += 1
+            requests += 1
+        elapsed = time.monotonic() - started
+        return ProbeResult(baudrate, True, round_trip, requests, failures, self._frame_errors(), self._bytes,
+                           elapsed)
+
+    def _frame_errors(self) -> int:
+        decoder = self._decoder
+        return decoder.checksum_errors + decoder.escape_errors + decoder.length_errors
+
+    def _request(self, message_type: const.MessageType, message_data: bytearray = None) -> bytearray | None:
+        """
+        Send a request and wait for its response.
+
+        :param message_type: Request type.
+        :param message_data: Ancillary message data, if used.
+        :return: The response message, or None if the panel did not answer it within PROBE_TIMEOUT.
+        """
+        frame = codec.encode_frame(message_type, message_data)
+        self._conn.write(frame)
+        self._bytes += len(frame)
+        valid_response = const.CommandTable[message_type].valid_response
+        deadline = time.monotonic() + PROBE_TIMEOUT
+        while time.monotonic() < deadline:
+            first = self._conn.read(1)
+            if not first:
+                continue
+            received = self._decoder.bytes_received
+            self._decoder.feed(first)
+            self._decoder.read_from(self._conn)
+            self._bytes += self._decoder.bytes_received - received
+            for message in self._decoder.frames():
+                if message[0] & reader.ACK_REQUESTED:
+                    self._conn.write(reader.ACK_FRAME)
+                    self._bytes += len(reader.ACK_FRAME)
+                response_type = message[0] & ~0xc0
+                if response_type in valid_response:
+                    return message
+                if response_type in const.NegativeResponses:
+                    return None
+        return None
@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import threading
+import time
+
+import constants as const
+
+RATE_LIMIT_INTERVAL = 60.0  # Seconds over which repeats of one warning or error are counted
+RATE_LIMIT_BURST = 3        # Repeats logged per interval before the rest are suppressed and summarized
+DUMP_INTERVAL = 60.0        # Minimum seconds between frame history dumps
+
+_SUMMARY = "rate_limit_summary"  # LogRecord attribute marking summaries, which are never suppressed
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Suppresses repeats of the same warning or error beyond RATE_LIMIT_BURST per RATE_LIMIT_INTERVAL.
+
+    Messages are grouped by level and text. The next message of a group logged after its interval, or flush(),
+    reports how many were suppressed, so a continuous checksum failure costs a few lines a minute instead of one
+    per frame. Debug and info messages are left to the logger level.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        super().__init__()
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._groups: dict[tuple[int, str], list] = {}  # (level, text) -> [window start, logged, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or getattr(record, _SUMMARY, False):
+            return True
+        key = (record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None or now - group[0] >= RATE_LIMIT_INTERVAL:
+                suppressed = group[2] if group else 0
+                self._groups[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+                    record.args = ()
+                return True
+            if group[1] < RATE_LIMIT_BURST:
+                group[1] += 1
+                return True
+            group[2] += 1
+            return False
+
+    def flush(self) -> None:
+        """
+        Report groups whose interval has ended with suppressed messages, and forget idle groups.
+        :return: None
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [(key, group[2]) for key, group in self._groups.items()
+                       if now - group[0] >= RATE_LIMIT_INTERVAL]
+            for key, _ in expired:
+                del self._groups[key]
+        for (level, text), suppressed in expired:
+            if suppressed:
+                self._logger.log(level, f"{text} (repeated {suppressed} more times)", extra={_SUMMARY: True})
+
+
+class FrameHistory:
+    """
+    Ring buffer of the most recent frames in both directions. Frames are stored raw and only formatted when the
+    history is dumped, so recording one is a deque append.
+    """
+
+    def __init__(self, size: int):
+        self._frames: collections.deque[tuple[float, str, bytes]] = collections.deque(maxlen=size)
+        self._recorded = 0
+        self._dumped = 0
+
+    def resize(self, size: int) -> None:
+        self._frames = collections.deque(self._frames, maxlen=size)
+
+    def record(self, direction: str, frame: bytes | bytearray) -> None:
+        """
+        :param direction: "RX" or "TX".
+        :param frame: The message, starting from the message type byte.
+        :return: None
+        """
+        if self._frames.maxlen:
+            self._frames.append((time.monotonic(), direction, bytes(frame)))
+            self._recorded += 1
+
+    def dump(self, logger: logging.Logger, reason: str, level: int = logging.WARNING) -> bool:
+        """
+        Log the buffered frames, oldest first, unless none arrived since the last dump.
+        :param logger: Logger to write to.
+        :param reason: Message that triggered the dump.
+        :param level: Level to log at.
+        :return: True if anything was logged.
+        """
+        frames = list(self._frames)
+        if not frames or self._recorded == self._dumped:
+            return False
+        self._dumped = self._recorded
+        now = time.monotonic()
+        logger.log(level, f"Last {len(frames)} frames before: {reason}")
+        for timestamp, direction, frame in frames:
+            logger.log(level, f"  {timestamp - now:8.3f}s {direction} {frame.hex()}")
+        return True
+
+
+class FrameHistoryHandler(logging.Handler):
+    """Dumps the frame history when an error is logged anywhere in the plugin, at most once per DUMP_INTERVAL."""
+
+    def __init__(self, history: FrameHistory, logger: logging.Logger):
+        super().__init__(logging.ERROR)
+        self._history = history
+        self._logger = logger
+        self._dumped_at = -DUMP_INTERVAL
+        self._dumping = threading.local()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        now = time.monotonic()
+        if getattr(self._dumping, "active", False) or now - self._dumped_at < DUMP_INTERVAL:
+            return
+        self._dumping.active = True
+        try:
+            if self._history.dump(self._logger, record.getMessage(), record.levelno):
+                self._dumped_at = now
+        finally:
+            self._dumping.active = False
+
+
+class ProtocolLogging:
+    """
+    Per-category loggers for the protocol path, children of the plugin logger:
+
+    wire: frames sent and received, framing errors and ACKs; decode: received message contents; state: Indigo
+    device state changes; queue: command queue, retries and the startup sync.
+
+    Each category has its own level from the plugin preferences. Hot paths check isEnabledFor() before building
+    hex dumps or per-state strings, so disabled categories cost a level check. Warnings and errors in every
+    category are rate limited, and the first error after a quiet period dumps the recent frame history on the
+    wire logger, at the level of the error.
+    """
+
+    def __init__(self, logger: logging.Logger, history_size: int = 32):
+        self.history = FrameHistory(history_size)
+        self._loggers = {category: logger.getChild(category.value) for category in const.LogCategory}
+        self._filters = []
+        for category_logger in self._loggers.values():
+            rate_limit = RateLimitFilter(category_logger)
+            category_logger.addFilter(rate_limit)
+            self._filters.append(rate_limit)
+        self.wire = self._loggers[const.LogCategory.WIRE]
+        self.decode = self._loggers[const.LogCategory.DECODE]
+        self.state = self._loggers[const.LogCategory.STATE]
+        self.queue = self._loggers[const.LogCategory.QUEUE]
+        logger.addHandler(FrameHistoryHandler(self.history, self.wire))
+
+    def configure(self, prefs) -> int:
+        """
+        Apply category levels and the frame history size from the plugin preferences.
+        :param prefs: Plugin preferences.
+        :return: The lowest level enabled by any category.
+        """
+        levels = []
+        for category, category_logger in self._loggers.items():
+            level = logging.getLevelName(str(prefs.get(const.PPK[f"LOG_LEVEL_{category.name}"].value, "INFO")))
+            level = level if isinstance(level, int) else logging.INFO
+            category_logger.setLevel(level)
+            levels.append(level)
+        try:
+            self.history.resize(int(prefs.get(const.PPK.FRAME_HISTORY.value, 32)))
+        except ValueError:
+            self.history.resize(32)
+        return min(levels)
+
+    def flush(self) -> None:
+        """
+        Emit summaries of suppressed warnings and errors whose rate limit interval has ended.
+        :return: None
+        """
+        for rate_limit in self._filters:
+            rate_limit.flush()
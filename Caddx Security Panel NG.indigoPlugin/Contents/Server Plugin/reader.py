@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import queue
+import threading
+import time
+from enum import IntEnum
+
+import codec
+import constants as const
+import protolog
+
+ACK_REQUESTED = 0x80
+ACK_MESSAGE = bytes([const.MessageType.ACK])
+ACK_FRAME = codec.encode_frame(const.MessageType.ACK)
+RETRANSMIT_WINDOW = 1.0  # Seconds within which an identical ack-requested frame is treated as a retransmission
+
+
+class EventType(IntEnum):
+    FRAME = 1           # Complete message received from the panel
+    COMMAND = 2         # Outbound command queued
+    READER_FAILED = 3   # Reader thread stopped because of a serial error
+    STOP = 4            # Processing loop asked to stop
+
+
+class SerialReader(threading.Thread):
+    """
+    Dedicated reader thread for the panel serial connection.
+
+    Blocks on the port (bounded by the connection read timeout) instead of polling, feeds whatever arrives into a
+    FrameDecoder and posts each complete message to the event queue as (EventType.FRAME, message). The processing
+    loop therefore wakes only when there is something to do.
+
+    Messages with the ack-request bit are acknowledged here as soon as they pass the checksum, before any handler
+    runs, so slow handlers cannot make the panel time out and retransmit. The panel sends nothing else until its
+    message is acknowledged, so an identical ack-requested message arriving again within RETRANSMIT_WINDOW, with
+    no other message received and no request sent in between, is a retransmission: it is acknowledged again but
+    not posted. A request sent in between may be answered by a message identical to the one acknowledged, e.g. a
+    Zone Status response after a transition for the same zone, so that message is always posted.
+    """
+
+    def __init__(self, conn, events: queue.Queue, logger: logging.Logger = None, write_lock: threading.Lock = None,
+                 history: protolog.FrameHistory = None, name: str = "CaddxSerialReader"):
+        super().__init__(name=name, daemon=True)
+        self._conn = conn
+        self._events = events
+        self._logger = logger or logging.getLogger(__name__)
+        self._write_lock = write_lock or threading.Lock()
+        self._history = history or protolog.FrameHistory(0)
+        self._decoder = codec.FrameDecoder(self._logger)
+        self._stop_requested = threading.Event()
+        self._last_acked = b""
+        self._last_acked_at = 0.0
+        self.retransmissions = 0
+        self.acks_sent = 0
+        self.bytes_sent = 0
+
+    @property
+    def decoder(self) -> codec.FrameDecoder:
+        return self._decoder
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Ask the reader to stop and wait for it to exit. The wait is bounded by the connection read timeout.
+        :param timeout: Maximum time to wait for the thread to exit.
+        :return: None
+        """
+        self._stop_requested.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def request_sent(self) -> None:
+        """
+        Note that a request is being written to the panel, so the next message is not taken for a retransmission
+        of the last one acknowledged. Called with the write lock held, before the request is written.
+        :return: None
+        """
+        self._last_acked = b""
+
+    def _acknowledge(self, message: bytearray) -> bool:
+        """
+        ACK an ack-requested message and check whether it repeats the previous one.
+        :param message: The received message, starting from command byte.
+        :return: True if the message is a retransmission and should be dropped.
+        """
+        with self._write_lock:
+            self._conn.write(ACK_FRAME)
+        self._history.record("TX", ACK_MESSAGE)
+        self.acks_sent += 1
+        self.bytes_sent += len(ACK_FRAME)
+        now = time.monotonic()
+        duplicate = message == self._last_acked and now - self._last_acked_at < RETRANSMIT_WINDOW
+        self._last_acked = bytes(message)
+        self._last_acked_at = now
+        if duplicate:
+            self.retransmissions += 1
+            if self._logger.isEnabledFor(logging.DEBUG):
+                self._logger.debug(f"Dropped retransmitted message: {message.hex()}")
+        return duplicate
+
+    def run(self) -> None:
+        try:
+            while not self._stop_requested.is_set():
+                first = self._conn.read(1)  # Blocks until data arrives or the read timeout expires
+                if not first:
+                    continue
+                self._decoder.feed(first)
+                self._decoder.read_from(self._conn)
+                for message in self._decoder.frames():
+                    self._history.record("RX", message)
+                    if not message[0] & ACK_REQUESTED:
+                        self._last_acked = b""
+                    elif self._acknowledge(message):
+                        continue
+                    self._events.put((EventType.FRAME, message))
+        except Exception as err:
+            if not self._stop_requested.is_set():
+                self._logger.error(f"Serial read failed: {err}")
+                self._events.put((EventType.READER_FAILED, err))
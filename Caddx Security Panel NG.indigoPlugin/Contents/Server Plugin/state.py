@@ -0,0 +1,274 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import messages
+
+MAX_ZONES = 192
+MAX_PARTITIONS = 8
+
+# Zone record layout: one fixed-size slice of PanelState._zones per zone, indexed by zone number - 1
+ZONE_PARTITION_MASK = 0
+ZONE_TYPE_FLAGS1 = 1
+ZONE_TYPE_FLAGS2 = 2
+ZONE_TYPE_FLAGS3 = 3
+ZONE_CONDITION1 = 4
+ZONE_CONDITION2 = 5
+ZONE_RECORD_SIZE = 6
+
+# Partition record layout: bytes 2-8 of PartitionStatusRsp, indexed by partition number - 1
+PARTITION_RECORD_SIZE = 7
+PARTITION_LAST_USER = 3
+
+# System record layout: bytes 1-11 of SystemStatusRsp
+SYSTEM_RECORD_SIZE = 11
+SYSTEM_PANEL_ID = 0
+SYSTEM_VALID_PARTITIONS = 9
+
+# Known flags, kept per zone/partition
+KNOWN_SNAPSHOT = 0x01
+KNOWN_STATUS = 0x02
+
+# (Indigo state id, record offset, bit mask) for every boolean state derived from a record
+ZONE_STATE_BITS = (
+    ("faulted", ZONE_CONDITION1, 0x01),
+    ("tampered", ZONE_CONDITION1, 0x02),
+    ("trouble", ZONE_CONDITION1, 0x04),
+    ("bypassed", ZONE_CONDITION1, 0x08),
+    ("inhibited", ZONE_CONDITION1, 0x10),
+    ("lowBattery", ZONE_CONDITION1, 0x20),
+    ("supervisionLost", ZONE_CONDITION1, 0x40),
+    ("alarmMemory", ZONE_CONDITION2, 0x01),
+    ("bypassMemory", ZONE_CONDITION2, 0x02),
+)
+ZONE_SNAPSHOT_STATES = frozenset({"faulted", "trouble", "bypassed", "alarmMemory"})
+ZONE_TROUBLE_BITS = 0x66  # Tampered, trouble, low battery and lost supervision all show as trouble in a snapshot
+
+PARTITION_STATE_BITS = (
+    ("fireTrouble", 0, 0x02),
+    ("fire", 0, 0x04),
+    ("armed", 0, 0x40),
+    ("instant", 0, 0x80),
+    ("previousAlarm", 1, 0x01),
+    ("sirenOn", 1, 0x02),
+    ("steadySirenOn", 1, 0x04),
+    ("alarmMemory", 1, 0x08),
+    ("tamper", 1, 0x10),
+    ("stayMode", 2, 0x04),
+    ("chimeMode", 2, 0x08),
+    ("entryDelay", 2, 0x10),
+    ("exitDelay", 2, 0xc0),
+    ("zoneBypassed", 5, 0x01),
+    ("readyToArm", 5, 0x04),
+    ("readyToForceArm", 5, 0x08),
+)
+
+SYSTEM_STATE_BITS = (
+    ("groundFault", 2, 0x01),
+    ("phoneFault", 2, 0x02),
+    ("failToCommunicate", 2, 0x04),
+    ("fuseFault", 2, 0x08),
+    ("boxTamper", 2, 0x10),
+    ("sirenTrouble", 2, 0x20),
+    ("lowBattery", 2, 0x40),
+    ("acFail", 2, 0x80),
+    ("expanderTrouble", 3, 0x7f),
+    ("globalSirenOn", 4, 0x10),
+    ("acPowerOn", 5, 0x02),
+    ("walkTestMode", 6, 0x04),
+    ("lossOfSystemTime", 6, 0x08),
+)
+
+StateChanges = list[tuple[str, object]]
+
+
+def _diff(bits: tuple, old: bytes | bytearray, new: bytes | bytearray, only: frozenset = None) -> StateChanges:
+    """
+    List the boolean states whose bits differ between two records.
+    :param bits: State bit table.
+    :param old: Previous record, or None to report every state.
+    :param new: Updated record.
+    :param only: Restrict the result to these state ids.
+    :return: (state id, new value) pairs for changed states.
+    """
+    return [(key, bool(new[offset] & mask)) for key, offset, mask in bits
+            if (only is None or key in only) and (old is None or (old[offset] ^ new[offset]) & mask)]
+
+
+class PanelState:
+    """
+    Compact model of the panel's zone, partition and system status.
+
+    Each zone and partition is a fixed-size slice of one bytearray, so the whole model for 192 zones is about a
+    kilobyte. Messages are merged by comparing raw bytes first; only records that actually changed are decoded
+    into Indigo state changes, and only the states whose bits flipped are returned.
+    """
+
+    __slots__ = ("_zones", "_zone_known", "_partitions", "_partition_known", "_system", "_system_known")
+
+    def __init__(self):
+        self._zones = bytearray(MAX_ZONES * ZONE_RECORD_SIZE)
+        self._zone_known = bytearray(MAX_ZONES)
+        self._partitions = bytearray(MAX_PARTITIONS * PARTITION_RECORD_SIZE)
+        self._partition_known = bytearray(MAX_PARTITIONS)
+        self._system = bytearray(SYSTEM_RECORD_SIZE)
+        self._system_known = False
+
+    def merge_zone_status(self, message: messages.ZoneStatusRsp) -> tuple[int, StateChanges]:
+        """
+        Merge a Zone Status message.
+
+        :param message: The decoded message.
+        :return: Zone number (1-based) and the changed states.
+        """
+        index = message.zone
+        if index >= MAX_ZONES:
+            return index + 1, []
+        start = index * ZONE_RECORD_SIZE
+        record = self._zones[start:start + ZONE_RECORD_SIZE]
+        new = bytes(message[1:])
+        known = self._zone_known[index]
+        if known & KNOWN_STATUS and record == new:
+            return index + 1, []
+        self._zones[start:start + ZONE_RECORD_SIZE] = new
+        self._zone_known[index] = known | KNOWN_SNAPSHOT | KNOWN_STATUS
+        # The first full status reports every state, since a snapshot only covers some of them
+        return index + 1, _diff(ZONE_STATE_BITS, record if known & KNOWN_STATUS else None, new)
+
+    def merge_zones_snapshot(self, message: messages.ZonesSnapshotRsp) -> list[tuple[int, StateChanges]]:
+        """
+        Merge a Zones Snapshot message (16 zones, one nibble each). A zone whose snapshot changed after its full
+        status was read needs its full status again, e.g. after transitions missed while the link was down.
+
+        :param message: The decoded message.
+        :return: (zone number, changed states) for each zone that changed.
+        """
+        first = message.offset * 16
+        nibbles = message.zones
+        changes = []
+        for i in range(16):
+            index = first + i
+            if index >= MAX_ZONES:
+                break
+            nibble = (nibbles[i >> 1] >> (4 * (i & 1))) & 0x0f
+            start = index * ZONE_RECORD_SIZE
+            condition1 = self._zones[start + ZONE_CONDITION1]
+            condition2 = self._zones[start + ZONE_CONDITION2]
+            new1 = (condition1 & ~0x09) | (nibble & 0x01) | ((nibble & 0x02) << 2)
+            if not nibble & 0x04:
+                new1 &= ~ZONE_TROUBLE_BITS
+            elif not new1 & ZONE_TROUBLE_BITS:
+                new1 |= 0x04
+            new2 = (condition2 & ~0x01) | (nibble >> 3)
+            known = self._zone_known[index]
+            if known and new1 == condition1 and new2 == condition2:
+                continue
+            old = self._zones[start:start + ZONE_RECORD_SIZE] if known else None
+            self._zones[start + ZONE_CONDITION1] = new1
+            self._zones[start + ZONE_CONDITION2] = new2
+            self._zone_known[index] = KNOWN_SNAPSHOT
+            zone_changes = _diff(ZONE_STATE_BITS, old, self._zones[start:start + ZONE_RECORD_SIZE],
+                                 None if known & KNOWN_STATUS else ZONE_SNAPSHOT_STATES)
+            if zone_changes:
+                changes.append((index + 1, zone_changes))
+        return changes
+
+    def merge_partition_status(self, message: messages.PartitionStatusRsp) -> tuple[int, StateChanges]:
+        """
+        Merge a Partition Status message.
+
+        :param message: The decoded message.
+        :return: Partition number (1-based) and the changed states.
+        """
+        index = message.partition
+        if index >= MAX_PARTITIONS:
+            return index + 1, []
+        start = index * PARTITION_RECORD_SIZE
+        record = self._partitions[start:start + PARTITION_RECORD_SIZE]
+        new = bytes(message[1:])
+        known = self._partition_known[index]
+        if known and record == new:
+            return index + 1, []
+        self._partitions[start:start + PARTITION_RECORD_SIZE] = new
+        self._partition_known[index] = KNOWN_STATUS
+        old = record if known else None
+        changes = _diff(PARTITION_STATE_BITS, old, new)
+        if old is None or old[PARTITION_LAST_USER] != new[PARTITION_LAST_USER]:
+            changes.append(("lastUser", new[PARTITION_LAST_USER] + 1))
+        return index + 1, changes
+
+    def merge_system_status(self, message: messages.SystemStatusRsp) -> StateChanges:
+        """
+        Merge a System Status message.
+
+        :param message: The decoded message.
+        :return: The changed states.
+        """
+        new = bytes(message)
+        if self._system_known and self._system == new:
+            return []
+        old = self._system if self._system_known else None
+        self._system[:] = new
+        self._system_known = True
+        changes = _diff(SYSTEM_STATE_BITS, old, new)
+        if old is None or old[SYSTEM_PANEL_ID] != new[SYSTEM_PANEL_ID]:
+            changes.append(("panelId", new[SYSTEM_PANEL_ID]))
+        return changes
+
+    def zones_needing_detail(self) -> list[int]:
+        """
+        Zones whose snapshot shows a fault, bypass, trouble or alarm memory but whose full status is not known.
+        :return: Zone numbers (1-based).
+        """
+        zones = []
+        for index, known in enumerate(self._zone_known):
+            if known != KNOWN_SNAPSHOT:
+                continue
+            start = index * ZONE_RECORD_SIZE
+            if self._zones[start + ZONE_CONDITION1] or self._zones[start + ZONE_CONDITION2]:
+                zones.append(index + 1)
+        return zones
+
+    def valid_partitions(self) -> list[int]:
+        """
+        Partitions marked valid in the last System Status message.
+        :return: Partition numbers (1-based); empty if no System Status has been received yet.
+        """
+        if not self._system_known:
+            return []
+        valid = self._system[SYSTEM_VALID_PARTITIONS]
+        return [index + 1 for index in range(MAX_PARTITIONS) if valid & (1 << index)]
+
+    def zone_states(self, zone: int) -> StateChanges:
+        """
+        All known states of a zone, for initializing a newly started device.
+        :param zone: Zone number (1-based).
+        :return: (state id, value) pairs; empty if nothing is known about the zone yet.
+        """
+        index = zone - 1
+        if not 0 <= index < MAX_ZONES or not self._zone_known[index]:
+            return []
+        start = index * ZONE_RECORD_SIZE
+        only = None if self._zone_known[index] & KNOWN_STATUS else ZONE_SNAPSHOT_STATES
+        return _diff(ZONE_STATE_BITS, None, self._zones[start:start + ZONE_RECORD_SIZE], only)
+
+    def partition_states(self, partition: int) -> StateChanges:
+        """
+        All known states of a partition, for initializing a newly started device.
+        :param partition: Partition number (1-based).
+        :return: (state id, value) pairs; empty if nothing is known about the partition yet.
+        """
+        index = partition - 1
+        if not 0 <= index < MAX_PARTITIONS or not self._partition_known[index]:
+            return []
+        start = index * PARTITION_RECORD_SIZE
+        record = self._partitions[start:start + PARTITION_RECORD_SIZE]
+        return _diff(PARTITION_STATE_BITS, None, record) + [("lastUser", record[PARTITION_LAST_USER] + 1)]
+
+    def system_states(self) -> StateChanges:
+        """
+        All known system states, for initializing a newly started device.
+        :return: (state id, value) pairs; empty if no System Status has been received yet.
+        """
+        if not self._system_known:
+            return []
+        return _diff(SYSTEM_STATE_BITS, None, self._system) + [("panelId", self._system[SYSTEM_PANEL_ID])]
@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import commands
+import constants as const
+import state
+
+ZONES_PER_SNAPSHOT = 16
+
+
+class StartupSync:
+    """
+    Builds the initial zone, partition and system picture with as few requests as possible.
+
+    Stage 1 reads every zone with bulk Zones Snapshot requests (16 zones per frame) plus one System Status request.
+    Stage 2 asks for Partition Status of each valid partition and for full Zone Status only of the zones whose
+    snapshot bits show a fault, bypass, trouble or alarm memory. Responses are merged into the panel state by the
+    normal receive path; this class only sequences the requests and reports how long it took.
+
+    After a reconnect the same two stages reconcile the state with what changed while the link was down: the
+    snapshots flag the zones whose status moved, and only those that are faulted get a Zone Status request.
+
+    Requests the panel does not enable are left out. A panel without Zones Snapshot requests gets one Zone Status
+    request per zone in stage 1 instead, ZONES_PER_SNAPSHOT in flight at a time so they never fill the queue.
+    """
+
+    def __init__(self, engine: commands.CommandEngine, panel_state: state.PanelState, logger: logging.Logger = None,
+                 on_complete: Callable[["StartupSync"], None] = None, reconcile: bool = False):
+        """
+        :param engine: Command engine to send the requests with.
+        :param panel_state: Panel state the responses are merged into.
+        :param logger: Logger for progress messages.
+        :param on_complete: Callable invoked with the sync when it completes.
+        :param reconcile: True after a reconnect, when the state is being brought up to date rather than built.
+        """
+        self._engine = engine
+        self._state = panel_state
+        self._logger = logger or logging.getLogger(__name__)
+        self._on_complete = on_complete
+        self.reconcile = reconcile
+        self._name = "Reconciliation" if reconcile else "Startup sync"
+        self._outstanding = 0
+        self._zone_backlog: list[int] = []     # Zones (0-based) still to read when snapshots are not available
+        self._stage = 0
+        self._started = 0.0
+        self._frames_at_start = 0
+        self.elapsed = 0.0
+        self.frames = 0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._stage in (1, 2)
+
+    @property
+    def complete(self) -> bool:
+        return self._stage == 3
+
+    def start(self) -> None:
+        """
+        Queue the stage 1 requests. Must be called from the communication loop thread.
+        :return: None
+        """
+        self._started = time.monotonic()
+        self._frames_at_start = self._engine.frames_sent + self._engine.responses_received
+        self._stage = 1
+        if self._engine.supports(const.MessageType.ZonesSnapshotReq):
+            self._logger.debug(f"{self._name}: reading zone snapshots and system status")
+            for offset in range((state.MAX_ZONES + ZONES_PER_SNAPSHOT - 1) // ZONES_PER_SNAPSHOT):
+                self._submit(const.MessageType.ZonesSnapshotReq, bytearray([offset]))
+        else:
+            self._logger.debug(f"{self._name}: reading the status of every zone and system status")
+            self._zone_backlog = list(range(state.MAX_ZONES - 1, -1, -1))
+            for _ in range(ZONES_PER_SNAPSHOT):
+                self._submit_next_zone()
+        self._submit(const.MessageType.SystemStatusReq)
+
+    def cancel(self) -> None:
+        """
+        Abandon the sync; completions of requests already queued are ignored.
+        :return: None
+        """
+        self._stage = 0
+
+    def _submit_next_zone(self) -> None:
+        if self._zone_backlog:
+            self._submit(const.MessageType.ZoneStatusReq, bytearray([self._zone_backlog.pop()]))
+
+    def _submit(self, message_type: const.MessageType, message_data: bytearray = None) -> None:
+        if not self._engine.supports(message_type):
+            return
+        self._outstanding += 1
+        self.requests += 1
+        try:
+            self._engine.submit(message_type, message_data, callback=self._request_done,
+                                priority=const.CommandPriority.Normal)
+        except commands.CommandQueueFull as err:
+            self._logger.warning(f"{self._name}: {err}")
+            self._outstanding -= 1
+            self.failures += 1
+
+    def _request_done(self, future: Future) -> None:
+        if not self.running:
+            return
+        error = future.exception()
+        # Without snapshots every zone number is read, and the panel fails those it does not have
+        if error and not (self._stage == 1 and isinstance(error, commands.CommandRejected)
+                          and error.command == const.MessageType.ZoneStatusReq):
+            self.failures += 1
+        self._outstanding -= 1
+        if self._stage == 1:
+            self._submit_next_zone()
+        if self._outstanding:
+            return
+        if self._stage == 1:
+            self._stage = 2
+            zones = self._state.zones_needing_detail()
+            partitions = self._state.valid_partitions()
+            self._logger.debug(f"{self._name}: reading status of {len(partitions)} partition(s) "
+                               f"and {len(zones)} zone(s) needing detail")
+            for partition in partitions:
+                self._submit(const.MessageType.PartitionStatusReq, bytearray([partition - 1]))
+            for zone in zones:
+                self._submit(const.MessageType.ZoneStatusReq, bytearray([zone - 1]))
+            if self._outstanding:
+                return
+        self._stage = 3
+        self.elapsed = time.monotonic() - self._started
+        self.frames = self._engine.frames_sent + self._engine.responses_received - self._frames_at_start
+        failed = f", {self.failures} failed" if self.failures else ""
+        self._logger.info(f"{self._name} complete in {self.elapsed:.2f}s: {self.requests} requests, "
+                          f"{self.frames} frames{failed}")
+        if self._on_complete:
+            self._on_complete(self)
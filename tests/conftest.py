@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Caddx Security Panel NG.indigoPlugin", "Contents", "Server Plugin"))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
@@ -0,0 +1,110 @@
+import pytest
+
+import codec
+
+# Wire frames and the messages they carry
+INT_CONFIG_REQ = bytes.fromhex("7e 01 21 22 23")
+ZONE_NAME_REQ_7E = bytes.fromhex("7e 02 23 7d 5e a3 ca")          # Zone 0x7e: escaped start character
+ZONE_NAME_REQ_7D = bytes.fromhex("7e 02 23 7d 5d a2 c9")          # Zone 0x7d: escaped escape character
+ESCAPED_THROUGHOUT = bytes.fromhex("7e 03 7d 5d 7d 5e 7d 5d 7c fe")  # Type and data 0x7d 0x7e 0x7d
+ZONE_STATUS_RSP = bytes.fromhex("7e 08 84 04 12 00 00 00 00 00 a2 f4")
+
+
+def decode_all(*chunks: bytes) -> tuple[list[bytes], codec.FrameDecoder]:
+    decoder = codec.FrameDecoder()
+    messages = []
+    for chunk in chunks:
+        decoder.feed(chunk)
+        messages += [bytes(message) for message in decoder.frames()]
+    return messages, decoder
+
+
+def test_fletcher16():
+    assert codec.fletcher16(b"") == 0
+    assert codec.fletcher16(b"\x01\x21") == 0x2322
+    assert codec.fletcher16(b"\xff" * 2) == 0x0000
+
+
+@pytest.mark.parametrize("frame, message_type, message_data", [
+    (INT_CONFIG_REQ, 0x21, None),
+    (ZONE_NAME_REQ_7E, 0x23, b"\x7e"),
+    (ZONE_NAME_REQ_7D, 0x23, b"\x7d"),
+    (ESCAPED_THROUGHOUT, 0x7d, b"\x7e\x7d"),
+])
+def test_encode_frame(frame, message_type, message_data):
+    assert codec.encode_frame(message_type, message_data) == frame
+    assert codec.decode_frame(frame) == bytes([message_type]) + (message_data or b"")
+
+
+def test_stuff_round_trip():
+    data = bytes(range(256))
+    stuffed = codec.stuff(data)
+    assert b"\x7e" not in stuffed
+    assert codec.unstuff(stuffed) == data
+
+
+def test_unstuff_invalid_escape():
+    with pytest.raises(codec.EscapeError):
+        codec.unstuff(b"\x01\x7d\x01")
+
+
+def test_decode_frame_errors():
+    with pytest.raises(codec.ChecksumError):
+        codec.decode_frame(INT_CONFIG_REQ[:-1] + b"\x24")
+    with pytest.raises(codec.LengthError):
+        codec.decode_frame(bytes.fromhex("7e 02 21 22 23"))
+
+
+@pytest.mark.parametrize("frame, message", [
+    (ZONE_NAME_REQ_7E, b"\x23\x7e"),
+    (ZONE_NAME_REQ_7D, b"\x23\x7d"),
+    (ESCAPED_THROUGHOUT, b"\x7d\x7e\x7d"),
+])
+def test_decoder_escapes(frame, message):
+    messages, decoder = decode_all(frame)
+    assert messages == [message]
+    assert decoder.escape_errors == 0
+
+
+def test_decoder_invalid_escape():
+    messages, decoder = decode_all(bytes.fromhex("7e 02 23 7d 01 a2 c9") + INT_CONFIG_REQ)
+    assert messages == [b"\x21"]
+    assert decoder.escape_errors == 1
+
+
+def test_decoder_bad_checksum():
+    messages, decoder = decode_all(ZONE_STATUS_RSP[:-1] + b"\x00" + INT_CONFIG_REQ)
+    assert messages == [b"\x21"]
+    assert decoder.checksum_errors == 1
+
+
+@pytest.mark.parametrize("frame", [
+    bytes.fromhex("7e 00 21 22 23"),            # Zero length
+    bytes.fromhex("7e 09 84 04 12 00 00"),      # Longer than the data before the next start character
+])
+def test_decoder_bad_length(frame):
+    messages, decoder = decode_all(frame + INT_CONFIG_REQ)
+    assert messages == [b"\x21"]
+    assert decoder.length_errors == 1
+
+
+def test_decoder_resync_after_garbage():
+    messages, decoder = decode_all(b"\x00\x12\x34" + INT_CONFIG_REQ + b"\xff" + ZONE_STATUS_RSP)
+    assert messages == [b"\x21", ZONE_STATUS_RSP[2:-2]]
+    assert decoder.resyncs == 2
+    assert decoder.discarded_bytes == 4
+
+
+@pytest.mark.parametrize("split", range(1, len(ZONE_NAME_REQ_7E)))
+def test_decoder_split_frame(split):
+    messages, decoder = decode_all(ZONE_NAME_REQ_7E[:split], ZONE_NAME_REQ_7E[split:] + INT_CONFIG_REQ)
+    assert messages == [b"\x23\x7e", b"\x21"]
+    assert decoder.frames_decoded == 2
+    assert len(decoder) == 0
+
+
+def test_decoder_byte_at_a_time():
+    stream = ZONE_STATUS_RSP + ESCAPED_THROUGHOUT + INT_CONFIG_REQ
+    messages, decoder = decode_all(*(stream[i:i + 1] for i in range(len(stream))))
+    assert messages == [ZONE_STATUS_RSP[2:-2], b"\x7d\x7e\x7d", b"\x21"]
+    assert decoder.bytes_received == len(stream)
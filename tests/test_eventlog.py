@@ -0,0 +1,40 @@
+import commands
+import constants as const
+import eventlog
+import messages
+
+
+def log_event(event_number: int, minute: int) -> messages.LogEventInd:
+    return messages.LogEventInd(event_number=event_number, log_size=185, event_type=0, zone_user_device=1,
+                                partition=0, month=1, day=2, hour=3, minute=minute)
+
+
+def test_download_restarted_across_reconnect_ignores_requeued_request(tmp_path):
+    sent = []
+    engine = commands.CommandEngine(lambda message_type, message_data: sent.append(bytes(message_data)))
+    history = eventlog.EventHistory(str(tmp_path / "eventHistory.bin"))
+    last_event = log_event(7, minute=10)
+    history.append([eventlog.record_from_message(last_event)])
+    sync = eventlog.EventLogSync(engine, history)
+
+    # The high-water mark check is in flight when the link drops; the loop cancels the download and requeues it
+    sync.start()
+    engine.poll()
+    sync.cancel()
+    engine.suspend()
+
+    # On reconnect the new download's check merges into the requeued request, so its future has both callbacks
+    sync.start()
+    engine.poll()
+    assert sent == [b"\x07", b"\x07"]
+    engine.handle_message(const.MessageType.LogEventInd, last_event)
+
+    # The mark is still in the log, so the download goes on to the next entry instead of ending
+    assert sync.running
+    engine.poll()
+    assert sent[-1] == b"\x08"
+    engine.handle_message(const.MessageType.LogEventInd, log_event(8, minute=11))
+    engine.poll()
+    engine.handle_message(const.MessageType.FailedRequest, messages.EmptyRsp())
+    assert not sync.running
+    assert [record.event_number for record in history.query()] == [7, 8]
@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+import panel_simulator
+import probe
+
+
+@pytest.fixture
+def panel_at():
+    """Start a simulated panel at a baud rate, returning the host connection; the panel stops after the test."""
+    links = []
+
+    def start(baudrate: int) -> panel_simulator.SimulatedSerial:
+        conn, link = panel_simulator.simulated_connection(panel_simulator.SimulatedPanel(), baudrate=baudrate,
+                                                          timeout=0.05)
+        links.append(link)
+        return conn
+
+    yield start
+    for link in links:
+        link.stop()
+
+
+def test_auto_finds_panel_rate(panel_at, monkeypatch):
+    monkeypatch.setattr(probe, "PROBE_TIMEOUT", 0.1)
+    conn = panel_at(19200)
+
+    link_probe = probe.LinkProbe(conn)
+    result = link_probe.run(sorted(probe.BAUD_RATES, reverse=True))
+
+    assert result is not None and result.baudrate == 19200
+    assert result.reliable and result.requests == probe.BURST_REQUESTS
+    assert conn.baudrate == 19200
+    assert [(tried.baudrate, tried.answered) for tried in link_probe.results] == \
+        [(76800, False), (38400, False), (19200, True)]
+
+
+def test_stop_ends_probe(panel_at):
+    conn = panel_at(2400)
+    stop = threading.Event()
+    timer = threading.Timer(0.2, stop.set)
+
+    link_probe = probe.LinkProbe(conn, stop=stop)
+    timer.start()
+    started = time.monotonic()
+    result = link_probe.run(sorted(probe.BAUD_RATES, reverse=True))
+    elapsed = time.monotonic() - started
+
+    # The request in progress at the first rate finishes; no further rate is tried
+    assert result is None
+    assert len(link_probe.results) == 1
+    assert elapsed < 2 * probe.PROBE_TIMEOUT
@@ -0,0 +1,74 @@
+import queue
+
+import codec
+import reader
+
+# Zone 5 status with the ack-request bit set, as sent for a transition and as the answer to a Zone Status request
+ZONE_STATUS = codec.encode_frame(0x84 | reader.ACK_REQUESTED, bytes([0x04, 0x01, 0, 0, 0, 0x01, 0]))
+SYSTEM_STATUS = codec.encode_frame(0x08, bytes(11))
+
+
+class ScriptedConnection:
+    """Serial connection that plays back a list of reads, calling an action with the reader before each one."""
+
+    def __init__(self, script: list):
+        self._script = list(script)
+        self._pending = b""
+        self.reader = None
+        self.written = bytearray()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._pending)
+
+    def read(self, size: int = 1) -> bytes:
+        if not self._pending:
+            if not self._script:
+                raise EOFError("End of script")
+            action, self._pending = self._script.pop(0)
+            if action:
+                action(self.reader)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data: bytes) -> int:
+        self.written += data
+        return len(data)
+
+
+def run_reader(script: list) -> tuple[list[bytes], reader.SerialReader]:
+    events = queue.Queue()
+    conn = ScriptedConnection(script)
+    serial_reader = conn.reader = reader.SerialReader(conn, events)
+    serial_reader.start()
+    serial_reader.join(5.0)
+    frames = []
+    while not events.empty():
+        event_type, payload = events.get_nowait()
+        if event_type == reader.EventType.FRAME:
+            frames.append(bytes(payload))
+    return frames, serial_reader
+
+
+def test_retransmission_dropped():
+    frames, serial_reader = run_reader([(None, ZONE_STATUS), (None, ZONE_STATUS)])
+    assert len(frames) == 1
+    assert serial_reader.acks_sent == 2
+    assert serial_reader.retransmissions == 1
+
+
+def test_identical_response_to_request_posted():
+    frames, serial_reader = run_reader([(None, ZONE_STATUS), (reader.SerialReader.request_sent, ZONE_STATUS)])
+    assert len(frames) == 2
+    assert serial_reader.retransmissions == 0
+
+
+def test_identical_message_after_other_frame_posted():
+    frames, serial_reader = run_reader([(None, ZONE_STATUS), (None, SYSTEM_STATUS), (None, ZONE_STATUS)])
+    assert len(frames) == 3
+    assert serial_reader.retransmissions == 0
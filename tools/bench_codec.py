@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the frame codec against the original per-byte implementation.
+
+Usage: python tools/bench_codec.py [--frames N] [--repeat R]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "Caddx Security Panel NG.indigoPlugin", "Contents", "Server Plugin"))
+
+import codec  # noqa: E402
+
+
+# Original implementation, kept here as the baseline for comparison
+
+def legacy_fletcher16(data: bytearray) -> int:
+    sum1 = int(0)
+    sum2 = int(0)
+    for byte in data:
+        sum1 = (sum1 + byte) % 255
+        sum2 = (sum2 + sum1) % 255
+    return (sum2 << 8) | sum1
+
+
+def legacy_encode(message_type: int, message_data: bytearray = None) -> bytearray:
+    message_length = 1 + len(message_data) if message_data else 1
+    message = bytearray()
+    message.append(message_length & 0xff)
+    message.append(message_type)
+    if message_data:
+        message.extend(message_data)
+    checksum = legacy_fletcher16(message)
+    message.extend(checksum.to_bytes(2, byteorder="little"))
+    message_stuffed = bytearray()
+    for i in message:
+        if i == 0x7e:
+            message_stuffed.append(0x7d)
+            message_stuffed.append(0x5e)
+        elif i == 0x7d:
+            message_stuffed.append(0x7d)
+            message_stuffed.append(0x5d)
+        else:
+            message_stuffed.append(i)
+    message_stuffed[0:0] = b'\x7e'
+    return message_stuffed
+
+
+def legacy_read_message(conn: io.BytesIO) -> None | bytearray:
+    start_character = conn.read(1)
+    if start_character != b'\x7e':
+        return None
+    message_length_byte = conn.read(1)
+    if not message_length_byte:
+        return None
+    message_data = bytearray()
+    message_data.extend(message_length_byte)
+    message_length = int.from_bytes(message_length_byte, byteorder='little')
+    for i in range(message_length + 2):
+        next_char = conn.read(1)
+        if next_char == b'\x7d':
+            next_char = conn.read(1)
+            if next_char == b'\x5e':
+                next_char = b'\x7e'
+            elif next_char == b'\x5d':
+                next_char = b'\x7d'
+            else:
+                return None
+        message_data.extend(next_char)
+    offered_checksum = int.from_bytes(message_data[-2:], byteorder='little')
+    del message_data[-2:]
+    if offered_checksum != legacy_fletcher16(message_data):
+        return None
+    del message_data[0]
+    return message_data
+
+
+def sample_messages(count: int) -> list[tuple[int, bytes]]:
+    """Representative traffic: mostly zone/partition transitions, some with bytes that need stuffing."""
+    rng = random.Random(584)
+    lengths = {0x04: 7, 0x05: 9, 0x06: 8, 0x08: 11, 0x03: 17, 0x1d: 0}
+    types = list(lengths)
+    result = []
+    for _ in range(count):
+        message_type = rng.choice(types)
+        data = bytes(rng.choice((0x7e, 0x7d, rng.randrange(256), 0, 0)) for _ in range(lengths[message_type]))
+        result.append((message_type, data))
+    return result
+
+
+def report(name: str, legacy: float, current: float, count: int) -> None:
+    print(f"{name:<12} legacy {legacy / count * 1e6:8.2f} us/frame   "
+          f"codec {current / count * 1e6:8.2f} us/frame   speedup {legacy / current:5.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=2000, help="frames per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs; the best is reported")
+    args = parser.parse_args()
+
+    samples = sample_messages(args.frames)
+    bodies = [bytearray([len(data) + 1, message_type]) + data for message_type, data in samples]
+    stream = b"".join(codec.encode_frame(message_type, data) for message_type, data in samples)
+    assert stream == b"".join(legacy_encode(message_type, bytearray(data)) for message_type, data in samples)
+    for body in bodies:
+        assert codec.fletcher16(body) == legacy_fletcher16(body)
+
+    def best(func) -> float:
+        return min(timeit.repeat(func, number=1, repeat=args.repeat))
+
+    report("checksum", best(lambda: [legacy_fletcher16(body) for body in bodies]),
+           best(lambda: [codec.fletcher16(body) for body in bodies]), args.frames)
+    report("encode", best(lambda: [legacy_encode(t, bytearray(d)) for t, d in samples]),
+           best(lambda: [codec.encode_frame(t, d) for t, d in samples]), args.frames)
+
+    def legacy_decode():
+        conn = io.BytesIO(stream)
+        return [legacy_read_message(conn) for _ in range(args.frames)]
+
+    def current_decode():
+        decoder = codec.FrameDecoder()
+        decoder.feed(stream)
+        return list(decoder.frames())
+
+    assert legacy_decode() == current_decode()
+    report("decode", best(legacy_decode), best(current_decode), args.frames)
+    print("Legacy decode reads one byte per call from an in-memory stream; against a real port each of those "
+          "calls is also a syscall.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput and latency benchmarks for the plugin's serial I/O path, run against the simulated panel.
+
+The host side is the plugin's own PanelInterface, with its reader thread, communication loop, command engine,
+startup sync and Indigo device updates, run outside Indigo through the indigo_stub module. Reported:
+  * frames/sec for a flood of transitions, with and without ACK requests;
+  * end-to-end event latency: panel write to message processed on the loop thread;
+  * request round trip through the command engine, and a full startup sync;
+  * CPU per frame on the reader and loop threads;
+  * memory growth over the flood, from tracemalloc;
+  * device state writes saved by the update batcher, with --window.
+
+Usage: python tools/bench_io.py [--frames N] [--zones N] [--baud B] [--pace] [--noise P] [--window S]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "Caddx Security Panel NG.indigoPlugin", "Contents", "Server Plugin"))
+
+import indigo_stub  # noqa: E402
+
+indigo = indigo_stub.install()
+
+import batcher  # noqa: E402
+import constants as const  # noqa: E402
+import panel  # noqa: E402
+import panel_simulator  # noqa: E402
+
+INTERFACE_ID = 1
+MERGED_TYPES = (const.MessageType.ZoneStatusRsp, const.MessageType.LogEventInd)
+
+
+class BenchInterface(panel.PanelInterface):
+    """PanelInterface that timestamps the zone and log messages it processes and samples its loop's CPU time."""
+
+    def __init__(self, plugin, device_id: int):
+        super().__init__(plugin, device_id)
+        self.merged_at: list[float] = []
+        self.loop_cpu_time = 0.0    # Loop thread CPU time when it last processed a message
+
+    def _process_received_message(self, message: bytearray) -> None:
+        super()._process_received_message(message)
+        if message[0] & ~0xc0 in MERGED_TYPES:
+            self.merged_at.append(time.monotonic())
+        self.loop_cpu_time = time.thread_time()
+
+
+class TimedConnection:
+    """Wraps the host connection and samples the reader thread's CPU time on each read."""
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "cpu_time", 0.0)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._conn, name, value)
+
+    def read(self, size: int = 1) -> bytes:
+        object.__setattr__(self, "cpu_time", time.thread_time())
+        return self._conn.read(size)
+
+    def readinto(self, buffer) -> int:
+        return self._conn.readinto(buffer)
+
+
+def start_interface(conn, zones: int, window: float) -> BenchInterface:
+    """
+    Start a panel interface on an open connection, with an Indigo device for every zone, and wait until its
+    startup sync and the background reads that follow are done.
+    :return: The running interface.
+    """
+    def open_connection(url: str, baudrate: int, timeout: float | None):
+        return conn
+
+    indigo.devices.clear()
+    plugin = indigo.PluginBase("com.example.caddx-bench", "Caddx bench", "0",
+                               {const.PPK.UPDATE_WINDOW.value: str(round(window * 1000))})
+    plugin.serial_factory = open_connection
+    device = indigo.devices[INTERFACE_ID] = indigo.Device(
+        INTERFACE_ID, "Bench panel", const.DeviceTypeId.PANEL_INTERFACE.value,
+        {f"{const.DPK.PORT.value}_serialPortLocal": "simulated", const.DPK.BAUD.value: str(conn.baudrate)})
+    interface = BenchInterface(plugin, INTERFACE_ID)
+    interface.start(device, device.pluginProps)
+    for zone in range(1, zones + 1):
+        zone_device = indigo.devices[100 + zone] = indigo.Device(
+            100 + zone, f"Zone {zone}", const.DeviceTypeId.ZONE.value,
+            {const.DPK.INTERFACE.value: str(INTERFACE_ID), const.DPK.ZONE_NUMBER.value: str(zone)})
+        interface.add_device(zone_device)
+    wait_until(lambda: settled(interface), 60.0)
+    return interface
+
+
+def settled(interface: BenchInterface) -> bool:
+    """
+    :return: True once the startup sync, zone name refresh and event log read are done and nothing is queued.
+    """
+    engine = interface._engine
+    return (interface._synced and engine is not None and not engine.busy and not interface._zone_name_refreshes
+            and interface._zone_name_reading is None and not interface._event_log.running)
+
+
+def wait_until(done, timeout: float) -> bool:
+    """
+    Poll done() until it is true or timeout expires.
+    :return: True if done() became true.
+    """
+    deadline = time.monotonic() + timeout
+    while not done():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "no samples"
+    values = sorted(values)
+
+    def pick(fraction: float) -> float:
+        return values[min(len(values) - 1, int(fraction * len(values)))] * 1e3
+
+    return f"p50 {pick(0.50):7.3f} ms   p99 {pick(0.99):7.3f} ms   max {values[-1] * 1e3:7.3f} ms"
+
+
+def connect(args, **link_options) -> tuple[BenchInterface, TimedConnection, panel_simulator.PanelLink, list]:
+    sent_at = []
+
+    def on_send(message_type: int, now: float) -> None:
+        if message_type & 0x7f in MERGED_TYPES:
+            sent_at.append(now)
+
+    faults = panel_simulator.FaultProfile(noise=args.noise, bad_checksum=args.noise / 2, bad_escape=args.noise / 2)
+    conn, link = panel_simulator.simulated_connection(panel_simulator.SimulatedPanel(args.zones),
+                                                      baudrate=args.baud, pace=args.pace, faults=faults,
+                                                      on_send=on_send, **link_options)
+    conn = TimedConnection(conn)
+    interface = start_interface(conn, args.zones, args.window)
+    # Only the traffic that follows counts
+    sent_at.clear()
+    interface.merged_at.clear()
+    return interface, conn, link, sent_at
+
+
+def bench_flood(args, ack: bool) -> None:
+    interface, conn, link, sent_at = connect(args, ack_transitions=ack, log_ratio=0.1)
+    serial_reader = interface._reader
+    updates = interface._batcher
+    queued, written, server_calls = updates.changes_queued, updates.changes_written, updates.server_calls
+    reader_cpu, loop_cpu = conn.cpu_time, interface.loop_cpu_time
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    link.send_transitions(args.frames)
+    wait_until(lambda: link.idle, 60.0)
+    # Corrupted frames are never delivered, so with noise only wait briefly for the stragglers
+    completed = wait_until(lambda: len(interface.merged_at) >= args.frames, 0.5 if args.noise else 5.0)
+    elapsed = time.perf_counter() - start
+    reader_cpu, loop_cpu = conn.cpu_time - reader_cpu, interface.loop_cpu_time - loop_cpu
+    growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    interface.stop()
+    link.stop()
+
+    label = "acked" if ack else "unacked"
+    received = len(interface.merged_at)
+    print(f"flood {label:<8} {received / elapsed:9.0f} frames/s   {received}/{args.frames} frames in "
+          f"{elapsed:.3f}s{'' if completed else '  (timed out)'}")
+    print(f"               cpu reader {reader_cpu / max(received, 1) * 1e6:6.1f} us/frame   "
+          f"loop {loop_cpu / max(received, 1) * 1e6:6.1f} us/frame   "
+          f"memory growth {growth / 1024:7.1f} KiB   peak {peak / 1024:7.1f} KiB")
+    print(f"               device updates {updates.changes_queued - queued} changes, "
+          f"{updates.changes_written - written} written in {updates.server_calls - server_calls} server calls "
+          f"(window {args.window * 1e3:.0f} ms)")
+    if ack:
+        # With ACKs the panel sends one transition at a time, so sends and merges pair up in order
+        latencies = [merged - sent for sent, merged in zip(sent_at, interface.merged_at)] if not args.noise else []
+        print(f"               event latency {percentiles(latencies)}   "
+              f"retransmissions {link.retransmissions}   dropped duplicates {serial_reader.retransmissions}")
+    decoder = serial_reader.decoder
+    if decoder.checksum_errors or decoder.escape_errors or decoder.resyncs:
+        print(f"               checksum errors {decoder.checksum_errors}   escape errors {decoder.escape_errors}   "
+              f"resyncs {decoder.resyncs}   faults injected {link.faults_injected}")
+
+
+def bench_requests(args) -> None:
+    interface, _, link, _ = connect(args)
+    startup = interface._sync
+    round_trips = []
+    for i in range(min(args.frames, 2000)):
+        start = time.monotonic()
+        future = interface._engine.submit(const.MessageType.ZoneStatusReq, bytearray([i % args.zones]))
+        future.result(5.0)
+        round_trips.append(time.monotonic() - start)
+    print(f"request        {len(round_trips) / sum(round_trips):9.0f} req/s      "
+          f"round trip {percentiles(round_trips)}")
+    print(f"startup sync   {startup.elapsed * 1e3:9.1f} ms         {startup.requests} requests, "
+          f"{startup.frames} frames, {startup.failures} failed")
+    interface.stop()
+    link.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=5000, help="transitions per flood run")
+    parser.add_argument("--zones", type=int, default=192)
+    parser.add_argument("--baud", type=int, default=38400)
+    parser.add_argument("--pace", action="store_true", help="limit the link to its wire speed at --baud")
+    parser.add_argument("--noise", type=float, default=0.0, help="probability of a corrupted frame")
+    parser.add_argument("--window", type=float, default=batcher.DEFAULT_WINDOW,
+                        help="device update window in seconds, 0 to write every change")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("Plugin")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    print(f"{args.frames} frames, {args.zones} zones, {args.baud} baud{' paced' if args.pace else ''}, "
+          f"noise {args.noise}")
+    bench_flood(args, ack=False)
+    bench_flood(args, ack=True)
+    bench_requests(args)
+    if not args.pace:
+        print("Unpaced runs measure host processing; add --pace for the limit imposed by the line rate.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the Indigo server's indigo module, enough to run the plugin's PanelInterface outside Indigo.
+
+install() registers the module as indigo, and must be called before the plugin modules are imported. Devices are
+kept in memory, the plugin data and log folders are in a temporary directory, and PluginBase.openSerial() returns
+whatever the plugin's serial_factory opens, e.g. a connection to the simulated panel.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from typing import Callable
+
+
+class Dict(dict):
+    """indigo.Dict, for plugin preferences, device properties and validation errors."""
+
+
+class Device:
+    """An Indigo device: its properties, and the states written to it."""
+
+    def __init__(self, device_id: int, name: str, device_type_id: str, props: dict = None):
+        self.id = device_id
+        self.name = name
+        self.deviceTypeId = device_type_id
+        self.pluginProps = Dict(props or {})
+        self.states = {}
+        self.server_calls = 0   # updateStatesOnServer() calls
+
+    def updateStatesOnServer(self, changes: list[dict]) -> None:
+        self.server_calls += 1
+        for change in changes:
+            self.states[change["key"]] = change["value"]
+
+    def replacePluginPropsOnServer(self, props: dict) -> None:
+        self.pluginProps = Dict(props)
+
+
+class DeviceList(dict):
+    """indigo.devices: Device by id."""
+
+    def iter(self, device_filter: str = None) -> list[Device]:
+        """
+        :param device_filter: "self.<deviceTypeId>", or None for every device.
+        :return: The matching devices.
+        """
+        device_type_id = device_filter.rpartition(".")[2] if device_filter else None
+        return [device for device in list(self.values())
+                if device_type_id is None or device.deviceTypeId == device_type_id]
+
+
+class Server:
+    """indigo.server, with its folders in a temporary directory created on first use."""
+
+    def __init__(self):
+        self._folder = None
+
+    def getInstallFolderPath(self) -> str:
+        if self._folder is None:
+            self._folder = tempfile.mkdtemp(prefix="indigo-")
+        return self._folder
+
+    def getLogsFolderPath(self, pluginId: str = None) -> str:
+        return os.path.join(self.getInstallFolderPath(), "Logs", pluginId or "")
+
+    @staticmethod
+    def log(message: str, *args, **kwargs) -> None:
+        logging.getLogger("indigo").info(message)
+
+
+class PluginBase:
+    """indigo.PluginBase. A serial port is the URL in props[<key>_serialPortLocal], opened by serial_factory."""
+
+    def __init__(self, plugin_id: str, plugin_display_name: str, plugin_version: str, plugin_prefs: dict):
+        self.pluginId = plugin_id
+        self.pluginDisplayName = plugin_display_name
+        self.pluginVersion = plugin_version
+        self.pluginPrefs = Dict(plugin_prefs or {})
+        self.logger = logging.getLogger("Plugin")
+        self.indigo_log_handler = logging.NullHandler()
+        self.logger.addHandler(self.indigo_log_handler)
+        self.debug = False
+        # (url, baud rate, read timeout) -> open connection, or None if it cannot be opened
+        self.serial_factory: Callable[[str, int, float | None], object] | None = None
+
+    @staticmethod
+    def getSerialPortUrl(props: dict, key: str) -> str:
+        return props.get(f"{key}_serialPortLocal", "")
+
+    def openSerial(self, ownerName: str, portUrl: str, baudrate: int, timeout: float = None, **kwargs):
+        return self.serial_factory(portUrl, int(baudrate), timeout) if self.serial_factory else None
+
+    @staticmethod
+    def validateSerialPortUi(values_dict: dict, errors_dict: dict, key: str) -> None:
+        pass
+
+
+devices = DeviceList()
+server = Server()
+
+
+def install():
+    """
+    Register this module as indigo, unless the real one is already loaded.
+    :return: The indigo module.
+    """
+    return sys.modules.setdefault("indigo", sys.modules[__name__])
@@ -0,0 +1,601 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Software NX-584/NX-8E panel for exercising the plugin's serial I/O without hardware.
+
+The simulated panel answers the requests the plugin sends (interface configuration, zone, partition, system, log,
+program data and user requests; keypad and bypass commands are ACKed), broadcasts zone and log transitions at a
+configurable rate and can inject line noise, bad checksums, bad escapes, NACKs and dropped requests.
+
+It can be reached three ways:
+  * in process, through simulated_connection(), which returns a pyserial-like SimulatedSerial for the host side;
+  * over a pty pair (pty mode), for pyserial's serial_for_url(<printed device path>);
+  * over TCP (tcp mode), for pyserial's serial_for_url("socket://127.0.0.1:<port>").
+pyserial's loop:// only echoes writes back to the writer, so it cannot put a panel on the other end of the link.
+
+Usage: python tools/panel_simulator.py {pty,tcp} [--port P] [--zones N] [--rate HZ] [--noise P] ...
+"""
+
+import argparse
+import collections
+import os
+import random
+import select
+import socket
+import sys
+import threading
+import time
+from typing import Callable, NamedTuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "Caddx Security Panel NG.indigoPlugin", "Contents", "Server Plugin"))
+
+import codec  # noqa: E402
+import constants as const  # noqa: E402
+
+MT = const.MessageType
+ACK_REQUESTED = 0x80
+BITS_PER_BYTE = 10  # Start bit, 8 data bits, stop bit
+
+ALL_TRANSITION_FLAGS = bytes([0xf2, 0x0f])
+ALL_REQUEST_FLAGS = bytes([0xfa, 0x1f, 0xff, 0xf8])
+
+
+class FaultProfile(NamedTuple):
+    noise: float = 0.0          # Probability of random bytes ahead of a frame
+    bad_checksum: float = 0.0   # Probability of a corrupted checksum
+    bad_escape: float = 0.0     # Probability of an invalid escape sequence inside a frame
+    nack: float = 0.0           # Probability of answering a request with NACK
+    drop: float = 0.0           # Probability of ignoring a request
+
+
+class SimulatedPanel:
+    """
+    Panel model: zone, partition and system records laid out like the corresponding status messages, zone names,
+    and a circular event log. respond() maps one request to its response messages.
+    """
+
+    def __init__(self, zones: int = 48, partitions: int = 1, seed: int = 584, firmware: bytes = b"1.00",
+                 request_flags: bytes = ALL_REQUEST_FLAGS, transition_flags: bytes = ALL_TRANSITION_FLAGS,
+                 log_size: int = 185):
+        self.rng = random.Random(seed)
+        self.zones = zones
+        self.partitions = partitions
+        self.firmware = firmware
+        self.request_flags = bytes(request_flags)
+        self.transition_flags = bytes(transition_flags)
+        self.zone_records = [bytearray([0x01, 0, 0, 0, 0, 0]) for _ in range(zones)]
+        self.zone_names = [f"Zone {zone + 1}".encode("ascii").ljust(16) for zone in range(zones)]
+        self.partition_records = [bytearray([0, 0, 0, 0, 0, 0x04, 0]) for _ in range(partitions)]
+        self.system_record = bytearray(11)
+        self.system_record[9] = (1 << partitions) - 1  # Valid partitions
+        self.system_record[5] = 0x02  # AC power on
+        self.log_size = log_size
+        self.log: list[bytes] = []
+        self.next_event = 0
+        self.transitions: collections.deque[tuple[int, bytes]] = collections.deque()
+        for zone in self.rng.sample(range(zones), min(zones, 3)):
+            self.zone_records[zone][4] |= 0x01  # A few zones start faulted
+
+    def supports(self, message_type: MT) -> bool:
+        flag = const.RequestFlags.get(message_type)
+        return flag is not None and bool(self.request_flags[flag[0]] & flag[1])
+
+    def respond(self, message_type: MT, data: bytes) -> list[tuple[int, bytes]]:
+        """
+        :param message_type: Request type, with the ack-request bits stripped.
+        :param data: Request data after the type byte.
+        :return: (message type, data) of each message to send back.
+        """
+        if not self.supports(message_type):
+            return [(MT.Rejected, b"")]
+        handler = getattr(self, f"_{message_type.name}", None)
+        if handler is None:
+            return [(MT.ACK, b"")]
+        return handler(data)
+
+    def random_transition(self) -> tuple[int, bytes]:
+        """
+        Change one zone at random, log it, and return the Zone Status broadcast.
+        :return: (message type, data) of the transition message.
+        """
+        zone = self.rng.randrange(self.zones)
+        self.zone_records[zone][4] ^= 0x01
+        self._log_event(0x00 if self.zone_records[zone][4] & 0x01 else 0x01, zone, 0)
+        return MT.ZoneStatusRsp, bytes([zone]) + self.zone_records[zone]
+
+    def latest_log_event(self) -> tuple[int, bytes]:
+        return MT.LogEventInd, self.log[-1]
+
+    def _log_event(self, event_type: int, zone_user_device: int, partition: int) -> None:
+        now = time.localtime()
+        event = bytes([self.next_event, self.log_size, event_type, zone_user_device, partition,
+                       now.tm_mon, now.tm_mday, now.tm_hour, now.tm_min])
+        self.log.append(event)
+        del self.log[:-self.log_size]
+        self.next_event = (self.next_event + 1) % self.log_size
+
+    def _zone(self, data: bytes) -> int | None:
+        return data[0] if data and data[0] < self.zones else None
+
+    def _IntConfigReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        return [(MT.IntConfigRsp, self.firmware + self.transition_flags + self.request_flags)]
+
+    def _ZoneNameReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        zone = self._zone(data)
+        if zone is None:
+            return [(MT.FailedRequest, b"")]
+        return [(MT.ZoneNameRsp, bytes([zone]) + self.zone_names[zone])]
+
+    def _ZoneStatusReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        zone = self._zone(data)
+        if zone is None:
+            return [(MT.FailedRequest, b"")]
+        return [(MT.ZoneStatusRsp, bytes([zone]) + self.zone_records[zone])]
+
+    def _ZonesSnapshotReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        offset = data[0]
+        nibbles = bytearray(8)
+        for i in range(16):
+            zone = offset * 16 + i
+            if zone >= self.zones:
+                break
+            record = self.zone_records[zone]
+            nibble = (record[4] & 0x01) | ((record[4] & 0x08) >> 2) | (0x04 if record[4] & 0x66 else 0) \
+                | ((record[5] & 0x01) << 3)
+            nibbles[i >> 1] |= nibble << (4 * (i & 1))
+        return [(MT.ZonesSnapshotRsp, bytes([offset]) + nibbles)]
+
+    def _PartitionStatusReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        if data[0] >= self.partitions:
+            return [(MT.FailedRequest, b"")]
+        return [(MT.PartitionStatusRsp, bytes([data[0]]) + self.partition_records[data[0]])]
+
+    def _PartitionSnapshotReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        snapshot = bytes(0x01 | (0x04 if partition < self.partitions and record[0] & 0x40 else 0)
+                         for partition, record in enumerate(self.partition_records))
+        return [(MT.PartitionSnapshotRsp, snapshot.ljust(8, b"\x00"))]
+
+    def _SystemStatusReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        return [(MT.SystemStatusRsp, bytes(self.system_record))]
+
+    def _LogEventReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        for event in self.log:
+            if event[0] == data[0]:
+                return [(MT.LogEventInd, event)]
+        return [(MT.FailedRequest, b"")]
+
+    def _ProgramDataReq(self, data: bytes) -> list[tuple[int, bytes]]:
+        return [(MT.ProgramDataRsp, bytes(data[:3]) + b"\x00" + bytes((data[2] + i) & 0xff for i in range(8)))]
+
+    def _UserInfoReqNoPin(self, data: bytes) -> list[tuple[int, bytes]]:
+        return [(MT.UserInfoRsp, bytes([data[0]]) + b"\x12\x34\xff" + bytes(12))]
+
+    def _UserInfoReqPin(self, data: bytes) -> list[tuple[int, bytes]]:
+        return self._UserInfoReqNoPin(data[3:])
+
+    def _ZoneBypassToggle(self, data: bytes) -> list[tuple[int, bytes]]:
+        zone = self._zone(data)
+        if zone is None:
+            return [(MT.FailedRequest, b"")]
+        self.zone_records[zone][4] ^= 0x08
+        self._log_event(0x04, zone, 0)
+        self.transitions.append((MT.ZoneStatusRsp, bytes([zone]) + self.zone_records[zone]))
+        return [(MT.ACK, b"")]
+
+
+class PanelLink(threading.Thread):
+    """
+    Runs a SimulatedPanel against a byte transport: decodes the host's frames, answers them, and sends transitions.
+
+    Like the real panel, transitions request an ACK and are retransmitted until one arrives (or retries run out),
+    and nothing else is broadcast while a transition is unacknowledged. With pace set, every frame takes its wire
+    time at the link baud rate to arrive.
+    """
+
+    def __init__(self, panel: SimulatedPanel, transport, faults: FaultProfile = FaultProfile(), rate: float = 0.0,
+                 log_ratio: float = 0.1, ack_transitions: bool = True, ack_timeout: float = 0.25,
+                 retransmits: int = 3, baudrate: int = 38400, pace: bool = False,
+                 on_send: Callable[[int, float], None] = None):
+        super().__init__(name="PanelSimulator", daemon=True)
+        self.panel = panel
+        self.faults = faults
+        self.rate = rate
+        self.log_ratio = log_ratio
+        self.ack_transitions = ack_transitions
+        self.ack_timeout = ack_timeout
+        self.retransmits = retransmits
+        self.baudrate = baudrate
+        self.pace = pace
+        self._transport = transport
+        self._on_send = on_send
+        self._decoder = codec.FrameDecoder()
+        self._stop_requested = threading.Event()
+        self._unacked: bytes | None = None
+        self._unacked_attempts = 0
+        self._retransmit_at = 0.0
+        self._next_transition = 0.0
+        self._transition_budget: int | None = None
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.requests = 0
+        self.transitions_sent = 0
+        self.retransmissions = 0
+        self.acks_received = 0
+        self.faults_injected = 0
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop_requested.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def send_transitions(self, count: int) -> None:
+        """
+        Send count transitions as fast as the link (and ACKs, if requested) allow, then stop broadcasting.
+        :param count: Number of transitions.
+        :return: None
+        """
+        self._transition_budget = count
+        self._next_transition = 0.0
+
+    @property
+    def idle(self) -> bool:
+        return self._unacked is None and not self._transition_budget and not self.panel.transitions
+
+    def run(self) -> None:
+        try:
+            while not self._stop_requested.is_set():
+                data = self._transport.recv(self._wait_time())
+                if data:
+                    self._decoder.feed(data)
+                    for message in self._decoder.frames():
+                        self._pace(len(message) + 4)
+                        self._handle(message)
+                self._broadcast()
+        except OSError:
+            pass  # Host side closed
+        finally:
+            self._transport.close()
+
+    def _wait_time(self) -> float:
+        if self._unacked is not None:
+            return max(0.0, self._retransmit_at - time.monotonic())
+        if self.panel.transitions or self._transition_budget:
+            return 0.0
+        if self.rate:
+            return max(0.0, self._next_transition - time.monotonic())
+        return 0.05
+
+    def _handle(self, message: bytearray) -> None:
+        self.frames_received += 1
+        try:
+            message_type = MT(message[0] & ~0xc0)
+        except ValueError:
+            self._send(MT.Rejected, b"")
+            return
+        if message_type == MT.ACK:
+            if self._unacked is not None:
+                self.acks_received += 1
+                self._unacked = None
+            return
+        if message_type == MT.NACK:
+            self._retransmit_at = 0.0
+            return
+        self.requests += 1
+        rng = self.panel.rng
+        if self.faults.drop and rng.random() < self.faults.drop:
+            return
+        if self.faults.nack and rng.random() < self.faults.nack:
+            self._send(MT.NACK, b"")
+            return
+        for response_type, response_data in self.panel.respond(message_type, bytes(message[1:])):
+            self._send(response_type, response_data)
+
+    def _broadcast(self) -> None:
+        now = time.monotonic()
+        if self._unacked is not None:
+            if now < self._retransmit_at:
+                return
+            if self._unacked_attempts > self.retransmits:
+                self._unacked = None  # Give up, as the panel does
+            else:
+                self.retransmissions += 1
+                self._unacked_attempts += 1
+                self._retransmit_at = now + self.ack_timeout
+                self._write_frame(self._unacked)
+                return
+        if self.panel.transitions:
+            message_type, data = self.panel.transitions.popleft()
+        elif self._transition_budget or (self.rate and now >= self._next_transition):
+            if self._transition_budget:
+                self._transition_budget -= 1
+            if self.rate:
+                self._next_transition = max(self._next_transition, now - 1.0) + 1.0 / self.rate
+            if self.panel.rng.random() < self.log_ratio:
+                self.panel.random_transition()
+                message_type, data = self.panel.latest_log_event()
+            else:
+                message_type, data = self.panel.random_transition()
+        else:
+            return
+        self.transitions_sent += 1
+        if self.ack_transitions:
+            frame = self._send(message_type | ACK_REQUESTED, data)
+            self._unacked = frame
+            self._unacked_attempts = 1
+            self._retransmit_at = time.monotonic() + self.ack_timeout
+        else:
+            self._send(message_type, data)
+
+    def _send(self, message_type: int, data: bytes) -> bytes:
+        frame = codec.encode_frame(message_type, data)
+        self._write_frame(frame, message_type)
+        return frame
+
+    def _write_frame(self, frame: bytes, message_type: int = None) -> None:
+        wire = self._inject_faults(frame)
+        self._pace(len(wire))
+        self._transport.send(wire)
+        self.frames_sent += 1
+        if self._on_send and message_type is not None:
+            self._on_send(message_type, time.monotonic())
+
+    def _inject_faults(self, frame: bytes) -> bytes:
+        faults = self.faults
+        if faults == FaultProfile():
+            return frame
+        rng = self.panel.rng
+        wire = bytearray(frame)
+        if faults.bad_checksum and rng.random() < faults.bad_checksum:
+            contents = bytearray(codec.unstuff(frame[1:]))
+            contents[-1] ^= 0x01
+            wire = bytearray(frame[:1] + codec.stuff(contents))
+            self.faults_injected += 1
+        if faults.bad_escape and rng.random() < faults.bad_escape:
+            wire[2:2] = b"\x7d\x11"
+            self.faults_injected += 1
+        if faults.noise and rng.random() < faults.noise:
+            wire[0:0] = bytes(rng.choice(range(0x7e)) for _ in range(rng.randint(1, 8)))
+            self.faults_injected += 1
+        return bytes(wire)
+
+    def _pace(self, length: int) -> None:
+        if self.pace:
+            time.sleep(length * BITS_PER_BYTE / self.baudrate)
+
+
+class _Pipe:
+    """One direction of an in-process serial link."""
+
+    def __init__(self):
+        self._data = bytearray()
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def write(self, data: bytes) -> None:
+        with self._cond:
+            if self.closed:
+                raise OSError("Link closed")
+            self._data += data
+            self._cond.notify_all()
+
+    def read(self, size: int, timeout: float | None) -> bytes:
+        with self._cond:
+            if not self._data and not self.closed:
+                self._cond.wait_for(lambda: self._data or self.closed, timeout)
+            if not self._data and self.closed:
+                raise OSError("Link closed")
+            data = bytes(self._data[:size])
+            del self._data[:size]
+            return data
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class _PipeTransport:
+    """Panel side of an in-process link."""
+
+    def __init__(self, host: "SimulatedSerial"):
+        self._host = host
+
+    def recv(self, timeout: float) -> bytes:
+        return self._host._to_panel.read(4096, timeout)
+
+    def send(self, data: bytes) -> None:
+        self._host._deliver(data)
+
+    def close(self) -> None:
+        self._host._to_host.close()
+
+
+class SimulatedSerial:
+    """
+    Host side of an in-process link, with the subset of the pyserial Serial API the plugin uses.
+
+    If baudrate differs from the panel link's baud rate, bytes in both directions are garbled, as they would be
+    on a real line with mismatched settings.
+    """
+
+    def __init__(self, baudrate: int = 38400, timeout: float | None = None, write_timeout: float | None = None):
+        self.port = "sim://panel"
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.link: PanelLink | None = None
+        self._to_host = _Pipe()
+        self._to_panel = _Pipe()
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @property
+    def is_open(self) -> bool:
+        return not self._to_panel.closed
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._to_host)
+
+    def read(self, size: int = 1) -> bytes:
+        data = self._to_host.read(size, self.timeout)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data: bytes | bytearray) -> int:
+        if self._to_host.closed:
+            raise OSError("Link closed")
+        self._to_panel.write(self._garble(bytes(data)))
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def reset_input_buffer(self) -> None:
+        while len(self._to_host):
+            self._to_host.read(len(self._to_host), 0)
+
+    def close(self) -> None:
+        self._to_panel.close()
+        self._to_host.close()
+
+    def _deliver(self, data: bytes) -> None:
+        self._to_host.write(self._garble(data))
+
+    def _garble(self, data: bytes) -> bytes:
+        if self.link is None or self.baudrate == self.link.baudrate:
+            return data
+        return bytes((byte * 7 + 3) & 0xff for byte in data)
+
+
+class _FdTransport:
+    """Panel side of a pty pair."""
+
+    def __init__(self, fd: int):
+        self._fd = fd
+
+    def recv(self, timeout: float) -> bytes:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        return os.read(self._fd, 4096) if readable else b""
+
+    def send(self, data: bytes) -> None:
+        os.write(self._fd, data)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _SocketTransport:
+    """Panel side of a TCP connection."""
+
+    def __init__(self, conn: socket.socket):
+        self._conn = conn
+
+    def recv(self, timeout: float) -> bytes:
+        self._conn.settimeout(timeout)
+        try:
+            data = self._conn.recv(4096)
+        except socket.timeout:
+            return b""
+        if not data:
+            raise OSError("Connection closed")
+        return data
+
+    def send(self, data: bytes) -> None:
+        self._conn.sendall(data)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def simulated_connection(panel: SimulatedPanel = None, baudrate: int = 38400, timeout: float | None = 0.5,
+                         **link_options) -> tuple[SimulatedSerial, PanelLink]:
+    """
+    Start a simulated panel and return an in-process connection to it.
+    :param panel: Panel model; a default 48 zone, 1 partition panel if omitted.
+    :param baudrate: Baud rate of both ends; change SimulatedSerial.baudrate or PanelLink.baudrate to mismatch.
+    :param timeout: Host read timeout, as for pyserial.
+    :param link_options: Further PanelLink options (faults, rate, pace, ...).
+    :return: Host connection and the running panel link.
+    """
+    conn = SimulatedSerial(baudrate, timeout)
+    link = PanelLink(panel or SimulatedPanel(), _PipeTransport(conn), baudrate=baudrate, **link_options)
+    conn.link = link
+    link.start()
+    return conn, link
+
+
+def serve_pty(panel: SimulatedPanel, **link_options) -> tuple[str, PanelLink]:
+    """
+    Start a simulated panel on the master side of a new pty pair.
+    :return: Device path of the slave side, for the plugin's serial port setting, and the running panel link.
+    """
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    link = PanelLink(panel, _FdTransport(master), **link_options)
+    link.start()
+    return os.ttyname(slave), link
+
+
+def serve_tcp(panel: SimulatedPanel, port: int, **link_options) -> PanelLink:
+    """
+    Wait for one TCP connection on localhost and run a simulated panel on it.
+    :return: The running panel link.
+    """
+    with socket.create_server(("127.0.0.1", port)) as server:
+        conn, _ = server.accept()
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    link = PanelLink(panel, _SocketTransport(conn), **link_options)
+    link.start()
+    return link
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mode", choices=("pty", "tcp"))
+    parser.add_argument("--port", type=int, default=10584, help="TCP port (tcp mode)")
+    parser.add_argument("--zones", type=int, default=48)
+    parser.add_argument("--partitions", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=1.0, help="transitions per second; 0 disables")
+    parser.add_argument("--baud", type=int, default=38400)
+    parser.add_argument("--pace", action="store_true", help="delay frames by their wire time at --baud")
+    parser.add_argument("--noise", type=float, default=0.0, help="probability of line noise before a frame")
+    parser.add_argument("--bad-checksum", type=float, default=0.0)
+    parser.add_argument("--bad-escape", type=float, default=0.0)
+    parser.add_argument("--nack", type=float, default=0.0, help="probability of NACKing a request")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of ignoring a request")
+    parser.add_argument("--seed", type=int, default=584)
+    args = parser.parse_args()
+
+    panel = SimulatedPanel(args.zones, args.partitions, args.seed)
+    options = dict(faults=FaultProfile(args.noise, args.bad_checksum, args.bad_escape, args.nack, args.drop),
+                   rate=args.rate, baudrate=args.baud, pace=args.pace)
+    if args.mode == "pty":
+        path, link = serve_pty(panel, **options)
+        print(f"Simulated panel on {path}")
+    else:
+        print(f"Waiting for a connection on socket://127.0.0.1:{args.port}")
+        link = serve_tcp(panel, args.port, **options)
+        print("Connected")
+    try:
+        while link.is_alive():
+            link.join(1.0)
+    except KeyboardInterrupt:
+        link.stop()
+    print(f"{link.requests} requests, {link.transitions_sent} transitions, {link.retransmissions} retransmissions, "
+          f"{link.faults_injected} faults injected")
+
+
+if __name__ == "__main__":
+    main()
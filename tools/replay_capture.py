@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Replay a raw serial capture through the plugin's receive path.
+
+The received bytes of a capture written with the plugin's "Capture serial traffic" option are played into the
+plugin's own PanelInterface, run outside Indigo through the indigo_stub module: its SerialReader and frame
+decoder, message handlers, panel state, command engine, panel cache, event log and device updates, for a device
+on every zone and partition. Playback is as fast as possible (the default) or at a multiple of the original
+timing; what the interface sends is discarded. Reports decode errors, message counts and throughput; --dump
+prints every decoded message and --profile runs the replay under cProfile.
+
+Usage: python tools/replay_capture.py CAPTURE [--speed X] [--dump] [--profile]
+"""
+
+import argparse
+import collections
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "Caddx Security Panel NG.indigoPlugin", "Contents", "Server Plugin"))
+
+import indigo_stub  # noqa: E402
+
+indigo = indigo_stub.install()
+
+import capture  # noqa: E402
+import constants as const  # noqa: E402
+import messages  # noqa: E402
+import panel  # noqa: E402
+import state  # noqa: E402
+
+INTERFACE_ID = 1
+
+
+class ReplayInterface(panel.PanelInterface):
+    """
+    PanelInterface that counts and optionally prints the messages it processes, and stops when the reader reaches
+    the end of the capture. The capture cannot answer heartbeats or a link probe, so neither is run.
+    """
+
+    def __init__(self, plugin, device_id: int, dump: bool = False, profiler: cProfile.Profile = None):
+        super().__init__(plugin, device_id)
+        self.dump = dump
+        self.profiler = profiler
+        self.type_counts = collections.Counter()
+        self.decoder = None
+        self.retransmissions = 0
+        self.finished_at = 0.0
+        self.finished = threading.Event()
+
+    def _run(self) -> None:
+        try:
+            if self.profiler:
+                self.profiler.runcall(super()._run)
+            else:
+                super()._run()
+        finally:
+            self.finished.set()
+
+    def _process_received_message(self, message: bytearray) -> None:
+        try:
+            message_type = const.MessageType(message[0] & ~0xc0)
+        except ValueError:
+            message_type = None
+        if message_type is not None:
+            self.type_counts[message_type] += 1
+            if self.dump:
+                print(f"{message_type.name}: {messages.decode(message_type, message)}")
+        super()._process_received_message(message)
+
+    def _check_heartbeat(self, now: float) -> float | None:
+        return None
+
+    def _framing_errors_climbing(self) -> bool:
+        return False
+
+    def _disconnect(self) -> None:
+        # The reader fails at the end of the capture like on a lost connection, after every frame was processed
+        self.finished_at = time.perf_counter()
+        self.decoder = self._reader.decoder
+        self.retransmissions = self._reader.retransmissions
+        super()._disconnect()
+        self.stop()
+
+
+class ProfiledConnection:
+    """Wraps the replay connection and profiles the thread reading from it: the interface's reader thread."""
+
+    def __init__(self, conn: capture.ReplayConnection, profiler: cProfile.Profile):
+        self._conn = conn
+        self._profiler = profiler
+        self._profiling = False
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def read(self, size: int = 1) -> bytes:
+        if not self._profiling:
+            self._profiling = True
+            self._profiler.enable()
+        try:
+            return self._conn.read(size)
+        except EOFError:
+            self._profiler.disable()
+            raise
+
+
+def start_interface(conn, dump: bool, profiler: cProfile.Profile | None) -> ReplayInterface:
+    """
+    Start a panel interface reading from the replay connection, with a device on every zone and partition.
+    :return: The running interface.
+    """
+    def open_connection(url: str, baudrate: int, timeout: float | None):
+        return conn
+
+    plugin = indigo.PluginBase("com.example.caddx-replay", "Caddx replay", "0", {})
+    plugin.serial_factory = open_connection
+    device = indigo.devices[INTERFACE_ID] = indigo.Device(
+        INTERFACE_ID, "Replay", const.DeviceTypeId.PANEL_INTERFACE.value,
+        {f"{const.DPK.PORT.value}_serialPortLocal": "capture", const.DPK.BAUD.value: "38400"})
+    interface = ReplayInterface(plugin, INTERFACE_ID, dump, profiler)
+    devices = [indigo.Device(100 + zone, f"Zone {zone}", const.DeviceTypeId.ZONE.value,
+                             {const.DPK.ZONE_NUMBER.value: str(zone)}) for zone in range(1, state.MAX_ZONES + 1)]
+    devices += [indigo.Device(10 + partition, f"Partition {partition}", const.DeviceTypeId.PARTITION.value,
+                              {const.DPK.PARTITION_NUMBER.value: str(partition)})
+                for partition in range(1, state.MAX_PARTITIONS + 1)]
+    for zone_or_partition in devices:
+        indigo.devices[zone_or_partition.id] = zone_or_partition
+        interface.add_device(zone_or_partition)
+    interface.start(device, device.pluginProps)
+    return interface
+
+
+def replay(paths: list[str], speed: float | None, dump: bool, profile: bool) -> None:
+    records = list(capture.read_capture(paths))
+    received = sum(len(record.data) for record in records if record.direction == capture.Direction.RX)
+    sent = sum(len(record.data) for record in records if record.direction == capture.Direction.TX)
+    span = records[-1].timestamp - records[0].timestamp if records else 0.0
+    print(f"{len(records)} records over {span:.1f}s: {received} bytes received, {sent} bytes sent")
+
+    # Framing and decoding run on the reader thread, message handling on the loop; profile each separately
+    profilers = {"reader thread": cProfile.Profile(), "communication loop": cProfile.Profile()} if profile else {}
+    conn = capture.ReplayConnection(records, speed)
+    if profile:
+        conn = ProfiledConnection(conn, profilers["reader thread"])
+    start = time.perf_counter()
+    interface = start_interface(conn, dump, profilers.get("communication loop"))
+    interface.finished.wait()
+    elapsed = max(interface.finished_at - start, 1e-9)
+
+    decoder = interface.decoder
+    print(f"{decoder.frames_decoded} frames in {elapsed:.3f}s ({decoder.frames_decoded / elapsed:.0f} frames/s), "
+          f"{interface._batcher.changes_queued} state changes")
+    print(f"checksum errors {decoder.checksum_errors}   escape errors {decoder.escape_errors}   "
+          f"length errors {decoder.length_errors}   resyncs {decoder.resyncs}   "
+          f"discarded bytes {decoder.discarded_bytes}   retransmissions {interface.retransmissions}")
+    for message_type, count in interface.type_counts.most_common():
+        print(f"  {message_type.name:<22} {count}")
+    for name, profiler in profilers.items():
+        print(f"\nProfile of the {name}:")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", help="capture file; its rotated backups are replayed first")
+    parser.add_argument("--speed", type=float, default=None, help="replay at this multiple of real time")
+    parser.add_argument("--dump", action="store_true", help="print every decoded message")
+    parser.add_argument("--profile", action="store_true", help="profile the replay")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    paths = capture.capture_files(args.capture) or [args.capture]
+    replay(paths, args.speed, args.dump, args.profile)
+
+
+if __name__ == "__main__":
+    main()